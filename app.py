@@ -1,102 +1,39 @@
 import streamlit as st
-import google.generativeai as genai
 from dotenv import load_dotenv
 import os
 from audio_recorder_streamlit import audio_recorder
 import speech_recognition as sr
 import io
-from gtts import gTTS
-from io import BytesIO
+import queue
 import time
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-
-# Voice configurations
-VOICES = {
-    "Female": {
-        "name": "Female",
-        "icon": "👩",
-        "tld": "com",  # US English female voice
-        "description": "Female voice"
-    },
-    "Male": {
-        "name": "Male",
-        "icon": "👨",
-        "tld": "co.uk",  # UK English male-like voice
-        "description": "Male voice"
-    }
-}
-
-# Language configurations
-LANGUAGES = {
-    "English": {
-        "name": "English",
-        "flag": "🇺🇸",
-        "tts_code": "en",
-        "speech_code": "en-US",
-        "display_name": "English"
-    },
-    "Spanish": {
-        "name": "Spanish",
-        "flag": "🇪🇸",
-        "tts_code": "es",
-        "speech_code": "es-ES",
-        "display_name": "Español"
-    },
-    "French": {
-        "name": "French",
-        "flag": "🇫🇷",
-        "tts_code": "fr",
-        "speech_code": "fr-FR",
-        "display_name": "Français"
-    },
-    "Chinese": {
-        "name": "Chinese",
-        "flag": "🇨🇳",
-        "tts_code": "zh-CN",
-        "speech_code": "zh-CN",
-        "display_name": "中文"
-    },
-    "Japanese": {
-        "name": "Japanese",
-        "flag": "🇯🇵",
-        "tts_code": "ja",
-        "speech_code": "ja-JP",
-        "display_name": "日本語"
-    }
-}
-
-# Personality configurations
-PERSONALITIES = {
-    "General Assistant": {
-        "name": "General Assistant",
-        "emoji": "🤖",
-        "description": "A helpful AI assistant for general tasks and questions",
-        "system_prompt": "You are a helpful, friendly, and knowledgeable AI assistant. Provide clear, concise, and accurate responses to user queries."
-    },
-    "Study Buddy": {
-        "name": "Study Buddy",
-        "emoji": "📚",
-        "description": "An AI tutor to help with learning and studying",
-        "system_prompt": "You are an encouraging and patient study buddy. Help users learn by breaking down complex topics, providing explanations, and asking questions to reinforce understanding. Use analogies and examples to make concepts clearer."
-    },
-    "Fitness Coach": {
-        "name": "Fitness Coach",
-        "emoji": "💪",
-        "description": "A motivational fitness and wellness coach",
-        "system_prompt": "You are an enthusiastic and motivating fitness coach. Provide workout advice, nutrition tips, and encouragement. Be positive, supportive, and focus on healthy, sustainable habits. Always remind users to consult healthcare professionals for medical advice."
-    },
-    "Gaming Helper": {
-        "name": "Gaming Helper",
-        "emoji": "🎮",
-        "description": "A gaming companion for tips, strategies, and game discussions",
-        "system_prompt": "You are a knowledgeable and enthusiastic gaming companion. Help users with game strategies, tips, walkthroughs, and general gaming discussions. Be friendly and share in their excitement about games."
-    }
-}
+# Local modules read their settings from the environment, so import them after load_dotenv
+from config import (
+    LANGUAGE_LABELS, LANGUAGE_OPTIONS, PERSONALITY_OPTIONS, VOICE_LABELS, VOICE_OPTIONS,
+)
+from engine import WARM_UP, get_engine, iterate_sync, run_sync, start_warm_up
+from gemini_chat import resilience_stats
+from tts import rate_limit_stats
+from tts_backends import unavailable_engines as unavailable_tts_engines
+from tts_cache import audio_cache
+from blob_store import recording_store
+from stt import StreamingTranscriber, get_backend as get_stt_backend, unavailable_engines as unavailable_stt_engines
+from audio_processing import frame_to_mono, resample
+from metrics import METRICS_PORT, metrics, metrics_server_error, start_metrics_server
+from audio_server import AUDIO_SERVER_PORT, audio_url, start_audio_server
+from audio_encoding import audio_duration, audio_encoder, audio_format, delivery_codec
+
+# Messages rendered per transcript page; older pages are loaded on demand
+TRANSCRIPT_PAGE_SIZE = int(os.getenv("TRANSCRIPT_PAGE_SIZE", "20"))
+
+# Optional live microphone streaming (pip install streamlit-webrtc)
+try:
+    from streamlit_webrtc import WebRtcMode, webrtc_streamer
+except ImportError:
+    webrtc_streamer = None
 
 # Page configuration
 st.set_page_config(
@@ -105,157 +42,270 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
+# Conversation engine shared by every session in the process
+engine = get_engine()
+
+# Build clients and engines in the background so the first turn doesn't pay for them (once per process)
+if WARM_UP:
+    start_warm_up()
 
-if 'personality' not in st.session_state:
-    st.session_state.personality = "General Assistant"
+# Prometheus-style /metrics endpoint on its own port (started once per process)
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT)
 
-if 'language' not in st.session_state:
-    st.session_state.language = "English"
+# Cached reply audio served by URL, so reruns don't send audio bytes through the page
+if AUDIO_SERVER_PORT:
+    start_audio_server(AUDIO_SERVER_PORT)
+
+script_start = time.perf_counter()
+
+# Initialize session state
+if 'session' not in st.session_state:
+    # Conversation state (messages, personality, language, voice, TTS speed) lives in the engine session;
+    # the conversation id in the URL brings a stored conversation back after a reload
+    conversation_id = st.query_params.get("conversation")
+    st.session_state.session = (
+        conversation_id and engine.resume_session(conversation_id)
+    ) or engine.create_session()
+    st.query_params["conversation"] = st.session_state.session.id
 
-if 'voice' not in st.session_state:
-    st.session_state.voice = "Female"
+session = st.session_state.session
 
 if 'voice_text' not in st.session_state:
     st.session_state.voice_text = ""
 
-if 'last_audio_bytes' not in st.session_state:
-    st.session_state.last_audio_bytes = None
+if 'last_recording_digest' not in st.session_state:
+    st.session_state.last_recording_digest = None  # Fingerprint of the last processed recording
 
 if 'message_sent' not in st.session_state:
     st.session_state.message_sent = False
 
-if 'tts_audio' not in st.session_state:
-    st.session_state.tts_audio = {}
-
 if 'processing_tts' not in st.session_state:
     st.session_state.processing_tts = False
 
-if 'tts_speed' not in st.session_state:
-    st.session_state.tts_speed = False  # False = normal speed, True = slow speed
-
 if 'command_feedback' not in st.session_state:
     st.session_state.command_feedback = None
 
-# Function to parse voice commands
-def parse_command(text):
-    """Parse user input for voice commands and return command type"""
-    text_lower = text.lower().strip()
-
-    # Command definitions with aliases
-    if any(keyword in text_lower for keyword in ['clear chat', 'clear history', 'reset chat', 'new chat']):
-        return 'clear_chat'
-    elif any(keyword in text_lower for keyword in ['change personality', 'switch personality', 'change mode']):
-        return 'change_personality'
-    elif any(keyword in text_lower for keyword in ['speak faster', 'speed up', 'faster', 'talk faster']):
-        return 'speak_faster'
-    elif any(keyword in text_lower for keyword in ['speak slower', 'slow down', 'slower', 'talk slower']):
-        return 'speak_slower'
-    elif any(keyword in text_lower for keyword in ['help', 'show commands', 'what can you do', 'commands']):
-        return 'help'
-
-    return None  # No command detected
-
-# Function to execute voice commands
-def execute_command(command):
-    """Execute the parsed voice command and return feedback message"""
-    if command == 'clear_chat':
-        st.session_state.messages = []
-        st.session_state.tts_audio = {}
-        return "✅ Chat history cleared!"
-
-    elif command == 'change_personality':
-        return "🔄 Please use the sidebar to select a different personality."
-
-    elif command == 'speak_faster':
-        st.session_state.tts_speed = False
-        return "⚡ TTS speed set to normal (faster)."
-
-    elif command == 'speak_slower':
-        st.session_state.tts_speed = True
-        return "🐢 TTS speed set to slow."
-
-    elif command == 'help':
-        return """📋 **Available Voice Commands:**
-
-- **"clear chat"** - Clear conversation history
-- **"change personality"** - Switch AI personality
-- **"speak faster"** - Increase TTS speed
-- **"speak slower"** - Decrease TTS speed
-- **"help"** - Show this command list
-
-You can also use natural variations like "reset chat", "speed up", etc."""
-
-    return None
-
-# Function to convert audio to text
-def transcribe_audio(audio_bytes, language_code="en-US"):
-    """Convert audio bytes to text using speech recognition"""
-    try:
-        # Initialize recognizer
-        recognizer = sr.Recognizer()
+if 'live_transcription' not in st.session_state:
+    st.session_state.live_transcription = False  # Transcribe while speaking (needs streamlit-webrtc)
 
-        # Convert bytes to audio data
-        audio_data = sr.AudioData(audio_bytes, sample_rate=16000, sample_width=2)
+if 'streaming' not in st.session_state:
+    st.session_state.streaming = True  # Stream replies and start TTS sentence by sentence
 
-        # Perform recognition with specified language
-        text = recognizer.recognize_google(audio_data, language=language_code)
-        return text, None
-    except sr.UnknownValueError:
-        return None, "Could not understand audio. Please try again."
-    except sr.RequestError as e:
-        return None, f"Could not request results from speech recognition service: {e}"
-    except Exception as e:
-        return None, f"Error during transcription: {str(e)}"
+if 'input_counter' not in st.session_state:
+    st.session_state.input_counter = 0  # Changes with each send, forcing a new empty message box
 
-# Function to generate text-to-speech audio
-def generate_tts_audio(text, message_index, language_code="en", voice_tld="com"):
-    """Generate TTS audio for the given text with progress feedback"""
+if 'transcript_pages' not in st.session_state:
+    st.session_state.transcript_pages = 1  # Pages of recent messages shown in the transcript
+
+if 'playback_handoff' not in st.session_state:
+    st.session_state.playback_handoff = None  # Reply whose streamed first sentence the transcript player continues
+
+if 'audio_codec' not in st.session_state:
+    # Reply audio codec this browser can play (Opus, or MP3 for Safari and iOS)
+    st.session_state.audio_codec = delivery_codec(st.context.headers.get("User-Agent"))
+    audio_encoder.use(st.session_state.audio_codec)  # Workers encode new replies for this browser too
+
+# Function to transcribe a live microphone stream
+def run_live_transcription(ctx, placeholder):
+    """Show partial transcripts while the user speaks and keep the final text on end of speech"""
+    lang = session.language_config
+    backend = get_stt_backend(lang['stt_engine'])
     try:
-        # Create unique cache key with language and voice
-        cache_key = f"{message_index}_{language_code}_{voice_tld}"
+        transcriber = StreamingTranscriber(backend, lang['speech_code'])  # Loads the model, which may be missing
+    except sr.RequestError as e:
+        placeholder.error(f"❌ Could not start live transcription: {e}")
+        return
+    placeholder.info("🎙️ Listening...")
 
-        # Check if audio already exists for this message, language, and voice
-        if cache_key in st.session_state.tts_audio:
-            return st.session_state.tts_audio[cache_key], None
+    while ctx.state.playing and not transcriber.ended:
+        try:
+            frames = ctx.audio_receiver.get_frames(timeout=1)
+        except queue.Empty:
+            continue
+        for frame in frames:
+            transcriber.accept(resample(frame_to_mono(frame), frame.sample_rate, backend.sample_rate))
+        if transcriber.partial:
+            placeholder.info(f"🎙️ {transcriber.partial}...")
 
-        # Truncate very long messages for TTS (>1000 chars)
-        if len(text) > 1000:
-            text = text[:1000] + "..."
-            warning_msg = "⚠️ Message truncated to 1000 characters for audio generation."
-        else:
-            warning_msg = None
+    try:
+        text = transcriber.finish()
+    except sr.RequestError as e:
+        placeholder.error(f"❌ Could not request results from speech recognition service: {e}")
+        return
 
-        # Show warning for long messages
-        if len(text) > 500 and warning_msg is None:
-            warning_msg = "⏳ Long message - audio generation may take a moment..."
+    if text:
+        st.session_state.voice_text = text
+        st.rerun()
 
-        # Generate TTS audio with spinner
-        with st.spinner("🎵 Generating audio..."):
-            # Add small delay to avoid rate limiting
-            time.sleep(0.5)
+# Function to display synthesized audio with any warnings/errors
+def show_tts_result(audio, feedback_msg, resume_at=None):
+    """Render the audio player for a reply (audio bytes or a URL) along with any TTS feedback
 
-            # Use session state speed setting, selected language, and voice
-            tts = gTTS(text=text, lang=language_code, slow=st.session_state.tts_speed, tld=voice_tld)
-            audio_buffer = BytesIO()
-            tts.write_to_fp(audio_buffer)
-            audio_buffer.seek(0)
-            audio_bytes = audio_buffer.read()
+    With resume_at (seconds), the player starts playing by itself from that position.
+    """
+    # Show warning or error message if any
+    if feedback_msg:
+        if "failed" in feedback_msg.lower():
+            st.error(feedback_msg)
+        else:
+            st.warning(feedback_msg)
+
+    # Display audio player with improved layout
+    if audio:
+        # Add divider for visual separation
+        st.markdown("---")
+
+        # Use columns for better layout
+        col_audio_label, col_audio_player = st.columns([1, 4])
+
+        with col_audio_label:
+            st.markdown("**🔊 Listen:**")
+
+        with col_audio_player:
+            st.audio(audio, format=audio_format(audio), start_time=resume_at or 0, autoplay=resume_at is not None)
+
+        # Add spacing after audio
+        st.markdown("")
+
+# Function to continue a streamed reply's playback after the page reruns
+def playback_resume_at(text):
+    """Seconds into reply text to resume playback from, if its first sentence was playing; otherwise None
+
+    The first sentence started playing before the rerun; the full reply picks up where it got to.
+    """
+    handoff = st.session_state.playback_handoff
+    if handoff is None or handoff["text"] != text:
+        return None
+    st.session_state.playback_handoff = None
+    return min(time.monotonic() - handoff["started"], handoff["played"])
+
+# Function to pick how finished audio is sent to the browser
+def reply_audio(text, result):
+    """Return (audio, feedback_msg) for a synthesis result, with audio as a URL when the audio server runs
+
+    Audio is sent in the compact codec negotiated for this browser. Returns
+    None while that variant is still being transcoded on the worker pool.
+    """
+    audio_bytes, feedback_msg = result
+    if not audio_bytes:
+        return audio_bytes, feedback_msg
+    codec = st.session_state.audio_codec
+    delivered = audio_encoder.lookup(engine.audio_key(session, text), audio_bytes, codec)
+    if delivered is None:
+        # Not encoded for this browser yet (e.g. synthesized before it connected); never transcode on the page
+        future = engine.submit_encoding(session, text, audio_bytes, codec)
+        if future is None or not future.done():
+            return None
+        delivered = future.result()
+    key, audio_bytes = delivered
+    return audio_url(key, audio_format(audio_bytes)) or audio_bytes, feedback_msg
+
+# Function to poll a background TTS job (runs as a fragment until the audio is ready)
+def pending_audio_player(text):
+    """Show a pending placeholder until synthesis completes, then rerun the page once to show the player"""
+    future = engine.submit_synthesis(session, text)
+    if future is not None and future.done() and reply_audio(text, future.result()) is not None:
+        # The full rerun renders the player in place of this fragment, which stops the polling
+        st.rerun()
+    st.caption("⏳ Pending audio...")
+
+# Function to offer a failed prompt for sending again
+def restore_failed_prompt():
+    """Put the prompt of a failed turn back in the message box and rerun; the error shows above the transcript"""
+    st.session_state.voice_text = session.last_error["prompt"]
+    st.session_state.input_counter += 1  # A new message box, so it picks up the restored text
+    st.rerun()
+
+# Function to render the message input (a fragment, so recording and editing don't rerun the transcript)
+def message_input():
+    """Render voice input, transcription status, the message box and the send button
+
+    Returns the live transcription context (or None) and the placeholder for partial transcripts.
+    """
+    st.markdown("### 💬 Send a Message")
+
+    # Voice Input Button
+    col_voice, col_status = st.columns([1, 3])
+
+    live_ctx = None
+
+    with col_voice:
+        st.markdown("**🎤 Voice Input**")
+        if st.session_state.live_transcription and webrtc_streamer is not None:
+            # Stream microphone frames so transcription happens while the user speaks
+            live_ctx = webrtc_streamer(
+                key="live_transcription",
+                mode=WebRtcMode.SENDONLY,
+                audio_receiver_size=1024,
+                media_stream_constraints={"video": False, "audio": True}
+            )
+            audio_bytes = None
+        else:
+            audio_bytes = audio_recorder(
+                text="",
+                recording_color="#e74c3c",
+                neutral_color="#3498db",
+                icon_name="microphone",
+                icon_size="2x",
+                pause_threshold=2.0,
+                sample_rate=16000
+            )
 
-            # Store in session state with language and voice-specific key
-            st.session_state.tts_audio[cache_key] = audio_bytes
+    with col_status:
+        # Filled with partial transcripts by the live transcription loop at the end of the page
+        live_placeholder = st.empty()
+
+        # Check if we have new audio (the recorder keeps returning its last recording)
+        recording_digest = recording_store.fingerprint(audio_bytes) if audio_bytes else None
+        if recording_digest and recording_digest != st.session_state.last_recording_digest:
+            with st.spinner("🎙️ Transcribing audio..."):
+                # Recognition uses the session's current language
+                text, error = run_sync(engine.transcribe(session, audio_bytes))
+                st.session_state.last_recording_digest = recording_digest
+                if text:
+                    st.session_state.voice_text = text
+                    st.success(f"✅ Transcribed: '{text}'")
+                elif error:
+                    st.error(f"❌ {error}")
+
+        # Show current transcription if available
+        if st.session_state.voice_text:
+            st.info(f"📝 Ready to send: {st.session_state.voice_text}")
+
+    # Text Input Section
+    st.markdown("**⌨️ Type or Edit Your Message:**")
+
+    # Display the transcribed text in an editable text area
+    # The key changes with each send, forcing a new empty widget
+    user_input = st.text_area(
+        "Message:",
+        value=st.session_state.voice_text,
+        height=100,
+        key=f"message_input_{st.session_state.input_counter}",
+        label_visibility="collapsed",
+        placeholder="Type your message here or use the microphone button above..."
+    )
+
+    # Send button
+    send_clicked = st.button("📤 Send Message", type="primary", use_container_width=True)
 
-        return audio_bytes, warning_msg
+    # Handle send button
+    if send_clicked:
+        if user_input.strip():
+            # Commands run immediately, anything else is queued as the next user message
+            feedback = engine.submit_message(session, user_input.strip())
+            if feedback:
+                st.session_state.command_feedback = feedback
 
-    except Exception as e:
-        # Handle specific rate limit errors
-        if "429" in str(e) or "Too Many Requests" in str(e):
-            error_msg = "⚠️ TTS rate limit reached. Please wait a moment before generating more audio."
+            # Clear input state (the recording digest is kept, so the same recording isn't transcribed again)
+            st.session_state.voice_text = ""
+            st.session_state.input_counter += 1
+            st.rerun()  # Reruns the whole page, not just this fragment, so the transcript updates
         else:
-            error_msg = f"❌ Audio generation failed: {str(e)}"
-        return None, error_msg
+            st.warning("⚠️ Please enter a message before sending.")
+
+    return live_ctx, live_placeholder
 
 # Sidebar
 with st.sidebar:
@@ -266,19 +316,19 @@ with st.sidebar:
     st.subheader("🌍 Choose Language")
     selected_language = st.selectbox(
         "Select Language:",
-        options=list(LANGUAGES.keys()),
-        index=list(LANGUAGES.keys()).index(st.session_state.language),
-        format_func=lambda x: f"{LANGUAGES[x]['flag']} {LANGUAGES[x]['display_name']}",
+        options=LANGUAGE_OPTIONS,
+        index=LANGUAGE_OPTIONS.index(session.language),
+        format_func=LANGUAGE_LABELS.get,
         key='language_selector'
     )
 
     # Update language if changed
-    if selected_language != st.session_state.language:
-        st.session_state.language = selected_language
+    if selected_language != session.language:
+        session.set_language(selected_language)
         st.rerun()
 
     # Display current language info
-    current_language = LANGUAGES[st.session_state.language]
+    current_language = session.language_config
     st.markdown(f"**Current:** {current_language['flag']} {current_language['display_name']}")
 
     st.markdown("---")
@@ -287,21 +337,19 @@ with st.sidebar:
     st.subheader("🎤 Choose Voice")
     selected_voice = st.selectbox(
         "Select Voice:",
-        options=list(VOICES.keys()),
-        index=list(VOICES.keys()).index(st.session_state.voice),
-        format_func=lambda x: f"{VOICES[x]['icon']} {VOICES[x]['name']}",
+        options=VOICE_OPTIONS,
+        index=VOICE_OPTIONS.index(session.voice),
+        format_func=VOICE_LABELS.get,
         key='voice_selector'
     )
 
     # Update voice if changed
-    if selected_voice != st.session_state.voice:
-        st.session_state.voice = selected_voice
-        # Clear TTS cache when voice changes
-        st.session_state.tts_audio = {}
+    if selected_voice != session.voice:
+        session.set_voice(selected_voice)
         st.rerun()
 
     # Display current voice info
-    current_voice = VOICES[st.session_state.voice]
+    current_voice = session.voice_config
     st.markdown(f"**Current:** {current_voice['icon']} {current_voice['name']}")
 
     st.markdown("---")
@@ -310,24 +358,40 @@ with st.sidebar:
     st.subheader("Choose Personality")
     selected_personality = st.selectbox(
         "Select AI Personality:",
-        options=list(PERSONALITIES.keys()),
-        index=list(PERSONALITIES.keys()).index(st.session_state.personality),
+        options=PERSONALITY_OPTIONS,
+        index=PERSONALITY_OPTIONS.index(session.personality),
         key='personality_selector'
     )
 
     # Update personality if changed
-    if selected_personality != st.session_state.personality:
-        st.session_state.personality = selected_personality
-        st.session_state.messages = []  # Clear chat history on personality change
+    if selected_personality != session.personality:
+        session.set_personality(selected_personality)  # Clears chat history
         st.rerun()
 
     # Display current personality info
-    current_personality = PERSONALITIES[st.session_state.personality]
+    current_personality = session.personality_config
     st.markdown(f"### {current_personality['emoji']} {current_personality['name']}")
     st.markdown(f"*{current_personality['description']}*")
 
     st.markdown("---")
 
+    # Streaming toggle
+    st.session_state.streaming = st.toggle(
+        "⚡ Stream responses",
+        value=st.session_state.streaming,
+        help="Show the reply as it is generated and start audio after the first sentence"
+    )
+
+    # Live transcription toggle (only when streamlit-webrtc is installed)
+    if webrtc_streamer is not None:
+        st.session_state.live_transcription = st.toggle(
+            "🎙️ Live transcription",
+            value=st.session_state.live_transcription,
+            help="Transcribe while you speak; the text is ready as soon as you stop"
+        )
+
+    st.markdown("---")
+
     # Voice Commands in expandable section
     with st.expander("🎤 Voice Commands", expanded=False):
         st.markdown("""
@@ -339,7 +403,7 @@ with st.sidebar:
         - 🐢 **"speak slower"** - Slow speed
         - ❓ **"help"** - Show all commands
 
-        **Tip:** You can also use variations like "reset chat", "speed up", etc.
+        **Tip:** You can also use variations like "reset chat", "speed up", etc., or say the command in your selected language.
         """)
 
     # Voice & Audio Features in expandable section
@@ -358,11 +422,98 @@ with st.sidebar:
         - 🔊 AI responses include audio in selected language
         - Click play to listen
         - Audio cached for speed
-        - Long messages may be truncated
+        - Long messages are synthesized in parallel segments
         """)
 
+        cache_stats = audio_cache.stats()
+        st.caption(
+            f"Audio cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses • "
+            f"{cache_stats['bytes'] / (1024 * 1024):.1f} MB of {cache_stats['max_bytes'] / (1024 * 1024):.0f} MB"
+        )
+        limiter_stats = rate_limit_stats()
+        st.caption(
+            f"TTS requests: {limiter_stats['requests']} sent • {limiter_stats['queued']} queued • "
+            f"{limiter_stats['throttled']} throttled • {limiter_stats['retried']} retried"
+        )
+
     st.markdown("---")
 
+    # Context window usage in expandable
+    with st.expander("🧠 Conversation Context", expanded=False):
+        usage = session.token_usage
+        if usage:
+            if usage['prompt_tokens'] is not None:
+                st.markdown(f"**Last prompt:** {usage['prompt_tokens']} tokens")
+            st.markdown(
+                f"**Recent turns:** ~{usage['window_tokens']} tokens "
+                f"(full history ~{usage['full_history_tokens']})"
+            )
+            st.markdown(f"**Summarized messages:** {usage['summarized_messages']}")
+        else:
+            st.markdown("No turns yet.")
+
+    # Per-stage latency and payload metrics in expandable
+    with st.expander("📈 Performance Metrics", expanded=False):
+        stages = metrics.stage_summary()
+        if stages:
+            st.markdown("**Stage latency (ms):**")
+            st.table([
+                {"stage": stage, "count": stats["count"], "errors": stats["errors"],
+                 "p50": round(stats["p50_ms"]), "p95": round(stats["p95_ms"])}
+                for stage, stats in stages.items()
+            ])
+        else:
+            st.markdown("No spans recorded yet.")
+
+        last_turn = metrics.turn_spans(session.id, session.turn)
+        if last_turn:
+            st.markdown(f"**Turn {session.turn}:** " + " • ".join(
+                f"{span['stage']} {span['ms']:.0f} ms" for span in last_turn
+            ))
+
+        payloads = metrics.payload_summary()
+        if payloads:
+            st.caption(" • ".join(
+                f"{name}: {p['count']} × {p['mean_bytes'] / 1024:.1f} KB" for name, p in payloads.items()
+            ))
+        cache_stats = audio_cache.stats()
+        st.caption(f"Audio cache hit rate: {cache_stats['hit_rate']:.0%}")
+        encoding = audio_encoder.stats()
+        if encoding["error"]:
+            st.caption(f"⚠️ Audio encoding unavailable, sending audio as synthesized: {encoding['error']}")
+        elif encoding["encoded"]:
+            st.caption(
+                f"Encoded reply audio ({encoding['bitrate']}): "
+                f"{encoding['source_bytes'] / encoding['encoded'] / 1024:.1f} KB → "
+                f"{encoding['encoded_bytes'] / encoding['encoded'] / 1024:.1f} KB per reply "
+                f"({encoding['ratio']:.1f}× smaller)"
+            )
+        if engine.response_cache is not None:
+            response_stats = engine.response_cache.stats()
+            st.caption(
+                f"Response cache: {response_stats['hits']} hits / {response_stats['misses']} misses • "
+                f"{response_stats['entries']} replies cached"
+            )
+        for name, reason in unavailable_stt_engines().items():
+            st.caption(f"⚠️ Speech recognition engine {name} unavailable, using Google instead: {reason}")
+        for name, reason in unavailable_tts_engines().items():
+            st.caption(f"⚠️ Text-to-speech engine {name} unavailable, using gTTS instead: {reason}")
+        gemini = resilience_stats()
+        st.caption(
+            f"Gemini: {gemini['retried']} retries • {gemini['hedged']} hedged ({gemini['hedge_wins']} won) • "
+            f"circuit {gemini['breaker_state'].replace('_', '-')}, opened {gemini['breaker_opened']}×"
+        )
+        memory = engine.memory_stats()
+        st.caption(
+            f"Session memory: {session.memory_usage() / 1024:.0f} KB of {memory['budget'] / 1024:.0f} KB budget • "
+            f"{memory['sessions']} sessions, {memory['bytes'] / 1024:.0f} KB total"
+        )
+        if METRICS_PORT:
+            if metrics_server_error():
+                st.caption(f"⚠️ Metrics endpoint unavailable: {metrics_server_error()}")
+            else:
+                st.caption(f"Prometheus endpoint: port {METRICS_PORT}, path /metrics")
+
     # About section in expandable
     with st.expander("ℹ️ About", expanded=False):
         st.markdown("""
@@ -370,208 +521,134 @@ with st.sidebar:
         - Streamlit UI
         - Google Gemini 2.5 Flash
         - Speech Recognition
-        - Text-to-Speech (gTTS)
+        - Text-to-Speech (gTTS or offline espeak-ng)
 
         **Tip:** Change personality to clear chat!
         """)
 
     # Clear chat button
     if st.button("🗑️ Clear Chat History"):
-        st.session_state.messages = []
+        session.reset()
+        st.session_state.transcript_pages = 1
         st.rerun()
 
 # Main chat interface
-current_lang = LANGUAGES[st.session_state.language]
-st.title(f"{PERSONALITIES[st.session_state.personality]['emoji']} AI Chatbot {current_lang['flag']}")
-st.markdown(f"*Currently chatting with: **{st.session_state.personality}** • Language: **{current_lang['display_name']}***")
+current_lang = session.language_config
+st.title(f"{session.personality_config['emoji']} AI Chatbot {current_lang['flag']}")
+st.markdown(f"*Currently chatting with: **{session.personality}** • Language: **{current_lang['display_name']}***")
 
 # Show command feedback if available
 if st.session_state.command_feedback:
     st.success(st.session_state.command_feedback)
     st.session_state.command_feedback = None  # Clear after displaying
 
+# Show why the last message got no reply (it is back in the message box until sent again)
+if session.last_error:
+    if session.last_error["message"].startswith("❌"):
+        st.error(session.last_error["message"])
+    else:
+        st.warning(session.last_error["message"])
+
 # Show helpful tip if no messages yet
-if len(st.session_state.messages) == 0:
+if len(session.messages) == 0:
     st.info("💡 **Quick Start:** Type a message or click the microphone to speak. Try saying 'help' to see voice commands!")
 
 # Display chat messages
-for idx, message in enumerate(st.session_state.messages):
+transcript_start = time.perf_counter()
+transcript_audio_bytes = 0  # audio inlined into the page by this rerun
+
+# Only the most recent pages are rendered; older messages load on demand
+hidden_count = max(0, len(session.messages) - TRANSCRIPT_PAGE_SIZE * st.session_state.transcript_pages)
+if hidden_count:
+    if st.button(f"⬆️ Show earlier messages ({hidden_count} hidden)"):
+        st.session_state.transcript_pages += 1
+        st.rerun()
+
+for message in session.messages[hidden_count:]:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
     # Display audio player for AI messages (outside chat_message container)
     if message["role"] == "model":
-        # Generate audio and get any warnings/errors
-        tts_lang_code = LANGUAGES[st.session_state.language]['tts_code']
-        voice_tld = VOICES[st.session_state.voice]['tld']
-        audio_result = generate_tts_audio(message["content"], idx, tts_lang_code, voice_tld)
-
-        if audio_result:
-            audio_bytes, feedback_msg = audio_result
-
-            # Show warning or error message if any
-            if feedback_msg:
-                if "failed" in feedback_msg.lower():
-                    st.error(feedback_msg)
-                else:
-                    st.warning(feedback_msg)
-
-            # Display audio player with improved layout
-            if audio_bytes:
-                # Add divider for visual separation
-                st.markdown("---")
-
-                # Use columns for better layout
-                col_audio_label, col_audio_player = st.columns([1, 4])
-
-                with col_audio_label:
-                    st.markdown("**🔊 Listen:**")
-
-                with col_audio_player:
-                    st.audio(audio_bytes, format='audio/mp3')
+        # Synthesis runs on the background pool so the transcript renders immediately
+        future = engine.submit_synthesis(session, message["content"])
+
+        reply = reply_audio(message["content"], future.result()) if future is not None and future.done() else None
+        if reply is not None:
+            audio, feedback_msg = reply
+            if isinstance(audio, bytes):
+                transcript_audio_bytes += len(audio)
+            show_tts_result(audio, feedback_msg, playback_resume_at(message["content"]))
+        else:
+            # Re-run just this player every second until its job completes
+            st.fragment(pending_audio_player, run_every=1.0)(message["content"])
 
-                # Add spacing after audio
-                st.markdown("")
+metrics.record("transcript_render", time.perf_counter() - transcript_start,
+               session=session.id, turn=session.turn, messages=len(session.messages))
+metrics.observe_size("transcript_audio", transcript_audio_bytes)
 
 # Voice Input Section
-st.markdown("### 💬 Send a Message")
-
-# Voice Input Button
-col_voice, col_status = st.columns([1, 3])
-
-with col_voice:
-    st.markdown("**🎤 Voice Input**")
-    audio_bytes = audio_recorder(
-        text="",
-        recording_color="#e74c3c",
-        neutral_color="#3498db",
-        icon_name="microphone",
-        icon_size="2x",
-        pause_threshold=2.0,
-        sample_rate=16000
-    )
-
-with col_status:
-    # Check if we have new audio (different from last processed)
-    if audio_bytes and audio_bytes != st.session_state.last_audio_bytes:
-        with st.spinner("🎙️ Transcribing audio..."):
-            # Get current language code for speech recognition
-            lang_code = LANGUAGES[st.session_state.language]['speech_code']
-            text, error = transcribe_audio(audio_bytes, lang_code)
-            if text:
-                st.session_state.voice_text = text
-                st.session_state.last_audio_bytes = audio_bytes
-                st.success(f"✅ Transcribed: '{text}'")
-            elif error:
-                st.session_state.last_audio_bytes = audio_bytes
-                st.error(f"❌ {error}")
-
-    # Show current transcription if available
-    if st.session_state.voice_text:
-        st.info(f"📝 Ready to send: {st.session_state.voice_text}")
-
-# Text Input Section
-st.markdown("**⌨️ Type or Edit Your Message:**")
-
-# Initialize the text input key dynamically
-if 'input_counter' not in st.session_state:
-    st.session_state.input_counter = 0
-
-# Display the transcribed text in an editable text area
-# The key changes with each send, forcing a new empty widget
-user_input = st.text_area(
-    "Message:",
-    value=st.session_state.voice_text,
-    height=100,
-    key=f"message_input_{st.session_state.input_counter}",
-    label_visibility="collapsed",
-    placeholder="Type your message here or use the microphone button above..."
-)
-
-# Send button
-send_clicked = st.button("📤 Send Message", type="primary", use_container_width=True)
-
-# Handle send button
-if send_clicked:
-    if user_input.strip():
-        # Check if input is a voice command
-        command = parse_command(user_input.strip())
-
-        if command:
-            # Execute the command
-            feedback = execute_command(command)
-            st.session_state.command_feedback = feedback
-
-            # Clear input state
-            st.session_state.voice_text = ""
-            st.session_state.last_audio_bytes = None
-            st.session_state.input_counter += 1
-            st.rerun()
-        else:
-            # Not a command, add as regular message to chat history
-            st.session_state.messages.append({"role": "user", "content": user_input.strip()})
-
-            # Clear state and increment counter
-            st.session_state.voice_text = ""
-            st.session_state.last_audio_bytes = None
-            st.session_state.input_counter += 1
-            st.rerun()
-    else:
-        st.warning("⚠️ Please enter a message before sending.")
+if st.session_state.live_transcription and webrtc_streamer is not None:
+    # The live transcription loop below needs the streamer context from this run
+    live_ctx, live_placeholder = message_input()
+else:
+    live_ctx = None
+    st.fragment(message_input)()
 
 # Process AI response if there's a new user message
-if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-    # Get the last user message
-    prompt = st.session_state.messages[-1]["content"]
-
+if session.pending_prompt is not None:
     # Display user message
     with st.chat_message("user"):
-        st.markdown(prompt)
+        st.markdown(session.pending_prompt)
 
     # Generate AI response
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
 
-        try:
-            # Get current language
-            current_lang = LANGUAGES[st.session_state.language]
-
-            # Build system instruction with personality and language
-            base_prompt = PERSONALITIES[st.session_state.personality]['system_prompt']
-            language_instruction = f"\n\nIMPORTANT: Please respond in {current_lang['display_name']}."
-
-            # Initialize the model with system instruction
-            model = genai.GenerativeModel(
-                'gemini-2.5-flash',
-                system_instruction=base_prompt + language_instruction
-            )
-
-            # Build conversation history for context
-            conversation_history = []
-            for msg in st.session_state.messages[:-1]:  # Exclude the last message (current prompt)
-                conversation_history.append({
-                    "role": msg["role"],
-                    "parts": [msg["content"]]
-                })
-
-            # Start chat with history
-            chat = model.start_chat(history=conversation_history)
-
-            # Get response
-            response = chat.send_message(prompt)
-            full_response = response.text
-
-            # Display response
+        if st.session_state.streaming:
+            # Stream the response; the engine hands finished sentences to TTS right away
+            audio_placeholder = st.empty()
+            pipeline = engine.speech_pipeline(session)
+            first_audio_played = False
+            playback_started = time.monotonic()
+            first_audio_seconds = 0.0  # how far the early playback can get before it runs out
+
+            full_response = ""
+            for chunk in iterate_sync(engine.respond_stream(session, pipeline)):
+                full_response += chunk
+                message_placeholder.markdown(full_response + "▌")
+
+                # Start playback as soon as the first sentence is synthesized
+                if not first_audio_played:
+                    first_audio = pipeline.first_audio()
+                    if first_audio:
+                        audio_placeholder.audio(first_audio, format=audio_format(first_audio), autoplay=True)
+                        first_audio_played = True
+                        playback_started = time.monotonic()
+                        first_audio_seconds = audio_duration(first_audio) or 0.0
+
+            if session.last_error:
+                restore_failed_prompt()
+
+            # The engine has recorded the reply as the last message
+            full_response = session.messages[-1]["content"]
             message_placeholder.markdown(full_response)
 
-            # Add assistant response to chat history
-            st.session_state.messages.append({"role": "model", "content": full_response})
+            # Cache the joined audio so the transcript doesn't synthesize it again
+            run_sync(engine.finish_speech(pipeline, full_response))
+            # The transcript's player takes over from the first sentence and plays the whole reply
+            st.session_state.playback_handoff = {
+                "text": full_response, "started": playback_started, "played": first_audio_seconds,
+            }
             st.rerun()
+        else:
+            # Get response (the engine adds it to the chat history, or hands the prompt back on failure)
+            full_response = run_sync(engine.respond(session))
+            if session.last_error:
+                restore_failed_prompt()
 
-        except Exception as e:
-            error_message = f"❌ Error: {str(e)}"
-            message_placeholder.markdown(error_message)
-            st.session_state.messages.append({"role": "model", "content": error_message})
+            # Display response
+            message_placeholder.markdown(full_response)
             st.rerun()
 
 # Footer
@@ -580,3 +657,11 @@ st.markdown(
     "<div style='text-align: center; color: gray;'>Powered by Google Gemini 2.5 Flash</div>",
     unsafe_allow_html=True
 )
+
+# Reruns cut short by st.rerun() never get here, so this is the time of complete page renders
+metrics.record("page_render", time.perf_counter() - script_start,
+               session=session.id, turn=session.turn, messages=len(session.messages))
+
+# Live transcription runs last, so the rest of the page is rendered while it listens
+if live_ctx is not None and live_ctx.audio_receiver:
+    run_live_transcription(live_ctx, live_placeholder)
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import wave
+from io import BytesIO
+
+from blob_store import BlobStore
+from metrics import metrics
+
+# Codec reply audio is transcoded to before it goes to the browser: "opus" (Ogg Opus),
+# "mp3", or "none" to send audio as synthesized
+AUDIO_CODEC = os.getenv("AUDIO_CODEC", "opus").lower()
+
+# Target bitrate of encoded replies; speech stays clear far below music bitrates
+AUDIO_BITRATE = os.getenv("AUDIO_BITRATE", "16k")
+
+# pydub export settings per codec (audio is down-mixed to mono first)
+CODECS = {
+    "opus": {"format": "ogg", "codec": "libopus", "parameters": ["-application", "voip"]},
+    "mp3": {"format": "mp3", "codec": "libmp3lame", "parameters": []},
+}
+
+# Safari and every iOS browser (they are all WebKit) can't play Ogg Opus
+APPLE_DEVICES = ("iPhone", "iPad", "iPod")
+NON_SAFARI_BROWSERS = ("Chrome", "Chromium", "Android")
+
+
+def audio_format(audio):
+    """MIME type of encoded audio, sniffed from its header (URLs are assumed to be MP3)"""
+    if isinstance(audio, bytes):
+        if audio[:4] == b"RIFF":
+            return "audio/wav"
+        if audio[:4] == b"OggS":
+            return "audio/ogg"
+    return "audio/mpeg"
+
+
+# MP3 bitrates in kbps by header index, for MPEG-1 and MPEG-2/2.5 Layer III
+MP3_BITRATES = {
+    "mpeg1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "mpeg2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+
+def audio_duration(audio_bytes):
+    """Seconds of audio in a WAV or constant-bitrate MP3 stream, or None if it can't be told from the header"""
+    if audio_bytes[:4] == b"RIFF":
+        try:
+            with wave.open(BytesIO(audio_bytes), "rb") as wav:
+                byte_rate = wav.getframerate() * wav.getnchannels() * wav.getsampwidth()
+        except (wave.Error, EOFError):
+            return None
+        # From the data size rather than the header's frame count, which espeak-ng leaves as a placeholder
+        return max(0, len(audio_bytes) - 44) / byte_rate
+    start = 0
+    if audio_bytes[:3] == b"ID3" and len(audio_bytes) >= 10:
+        size = audio_bytes[6:10]
+        start = 10 + (size[0] << 21 | size[1] << 14 | size[2] << 7 | size[3])
+    header = audio_bytes[start:start + 4]
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0 or (header[1] >> 1) & 3 != 1:
+        return None
+    bitrates = MP3_BITRATES["mpeg1" if (header[1] >> 3) & 3 == 3 else "mpeg2"]
+    kbps = bitrates[header[2] >> 4] if header[2] >> 4 < len(bitrates) else 0
+    return (len(audio_bytes) - start) * 8 / (kbps * 1000) if kbps else None
+
+
+def delivery_codec(user_agent):
+    """Codec to send a client, judged from its User-Agent: Apple browsers get MP3 instead of Opus"""
+    if AUDIO_CODEC != "opus" or not user_agent:
+        return AUDIO_CODEC
+    safari = "Safari" in user_agent and not any(name in user_agent for name in NON_SAFARI_BROWSERS)
+    if safari or any(device in user_agent for device in APPLE_DEVICES):
+        return "mp3"
+    return AUDIO_CODEC
+
+
+def transcode(audio_bytes, codec, bitrate):
+    """Re-encode audio as mono speech in codec at bitrate"""
+    # Imported lazily: pydub needs audioop (or audioop-lts on Python 3.13+) and ffmpeg
+    from pydub import AudioSegment
+
+    settings = CODECS[codec]
+    output = BytesIO()
+    AudioSegment.from_file(BytesIO(audio_bytes)).set_channels(1).export(
+        output, format=settings["format"], codec=settings["codec"], bitrate=bitrate,
+        parameters=settings["parameters"],
+    )
+    return output.getvalue()
+
+
+def encoder_unavailable(codec):
+    """Why codec can't be encoded on this machine, or None if ffmpeg has its encoder"""
+    try:
+        from pydub.utils import get_encoder_name
+    except ImportError as e:
+        return str(e) or type(e).__name__
+    ffmpeg = shutil.which(get_encoder_name())
+    if ffmpeg is None:
+        return "ffmpeg is not installed"
+    try:
+        encoders = subprocess.run(
+            [ffmpeg, "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        return str(e) or type(e).__name__
+    if CODECS[codec]["codec"] not in encoders:
+        return f"ffmpeg has no {CODECS[codec]['codec']} encoder"
+    return None
+
+
+class AudioEncoder:
+    """Transcodes synthesized audio for delivery and caches each encoded variant
+
+    Encoding needs ffmpeg with the codec's encoder. If a transcode fails
+    because that is missing, the codec is turned off for the process and
+    replies are sent as synthesized; other failures only affect that audio.
+    """
+
+    def __init__(self, store, bitrate=AUDIO_BITRATE):
+        self.store = store
+        self.bitrate = bitrate
+        self.encoded = 0
+        self.source_bytes = 0
+        self.encoded_bytes = 0
+        self.failed = 0  # transcodes that failed on their input
+        self.unavailable = {}  # codec -> why this machine can't encode it
+        self.codecs = {AUDIO_CODEC} & set(CODECS)  # codecs browsers of this process are sent
+        self._lock = threading.Lock()
+
+    def variant_key(self, key, codec):
+        """Key of the encoded variant of the audio cached under key"""
+        payload = "\x00".join([key, codec, self.bitrate])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def use(self, codec):
+        """Note that a browser is sent codec, so new audio is encoded for it ahead of time"""
+        if codec in CODECS:
+            with self._lock:
+                self.codecs.add(codec)
+
+    def encode_all(self, key, audio_bytes):
+        """Encode the audio cached under key in every codec browsers are being sent"""
+        with self._lock:
+            codecs = list(self.codecs)
+        for codec in codecs:
+            self.encode(key, audio_bytes, codec)
+
+    def lookup(self, key, audio_bytes, codec=AUDIO_CODEC):
+        """Return what encode() would, or None if that needs a transcode first; never transcodes"""
+        if codec not in CODECS or codec in self.unavailable:
+            return key, audio_bytes
+        variant = self.variant_key(key, codec)
+        if variant not in self.store:
+            return None
+        return self.encode(key, audio_bytes, codec)
+
+    def encode(self, key, audio_bytes, codec=AUDIO_CODEC):
+        """Return (key, audio_bytes) to deliver for the audio cached under key
+
+        The encoded variant is transcoded once and then read from the store.
+        The original comes back when codec is "none", encoding is unavailable
+        or failed, or the variant would not be smaller.
+        """
+        if codec not in CODECS or codec in self.unavailable:
+            return key, audio_bytes
+        variant = self.variant_key(key, codec)
+        encoded = self.store.get(variant)
+        if encoded is None:
+            try:
+                with metrics.span("audio_encode", codec=codec, bytes=len(audio_bytes)) as span:
+                    encoded = transcode(audio_bytes, codec, self.bitrate)
+                    span["encoded_bytes"] = len(encoded)
+            except Exception:
+                reason = encoder_unavailable(codec)
+                with self._lock:
+                    if reason is not None:
+                        self.unavailable[codec] = reason
+                    else:
+                        self.failed += 1  # e.g. undecodable input; the next reply may still encode
+                return key, audio_bytes
+            self.store.put(variant, encoded)
+            metrics.observe_size("tts_audio_encoded", len(encoded))
+            with self._lock:
+                self.encoded += 1
+                self.source_bytes += len(audio_bytes)
+                self.encoded_bytes += len(encoded)
+        if len(encoded) >= len(audio_bytes):
+            return key, audio_bytes
+        return variant, encoded
+
+    def stats(self):
+        """Return counters for display and monitoring"""
+        with self._lock:
+            return {
+                "encoded": self.encoded,
+                "source_bytes": self.source_bytes,
+                "encoded_bytes": self.encoded_bytes,
+                "ratio": self.source_bytes / self.encoded_bytes if self.encoded_bytes else 0.0,
+                "bitrate": self.bitrate,
+                "failed": self.failed,
+                "error": "; ".join(f"{codec}: {reason}" for codec, reason in self.unavailable.items()) or None,
+            }
+
+
+# Process-wide encoder; variants are kept next to the synthesized audio cache
+audio_encoder = AudioEncoder(BlobStore(
+    os.getenv("ENCODED_AUDIO_DIR", os.path.join(os.getenv("TTS_CACHE_DIR", ".tts_cache"), "encoded")),
+    int(os.getenv("ENCODED_AUDIO_MAX_BYTES", str(50 * 1024 * 1024))),
+))
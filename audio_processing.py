@@ -0,0 +1,204 @@
+import struct
+
+import numpy as np
+
+# WAV format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Energy-based voice activity detection settings
+VAD_FRAME_MS = 30
+VAD_PADDING_MS = 200  # kept around detected speech so word edges aren't clipped
+VAD_MIN_RMS = 0.01  # about -40 dBFS, anything quieter is always treated as silence
+VAD_NOISE_FACTOR = 3.0  # speech must be this much louder than the estimated noise floor
+
+
+class AudioDecodeError(ValueError):
+    """Raised when recorder output can't be decoded as audio"""
+
+
+def decode_wav(data):
+    """Decode a WAV container into (samples, sample_rate)
+
+    samples is a float32 array of shape (frames, channels) scaled to [-1, 1].
+    Handles PCM (8/16/24/32-bit), IEEE float and WAVE_FORMAT_EXTENSIBLE, and
+    tolerates the bogus chunk sizes written by streaming browser encoders.
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise AudioDecodeError("Audio is not a WAV file")
+
+    fmt = None
+    pcm = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack("<I", data[offset + 4:offset + 8])[0]
+        body = data[offset + 8:offset + 8 + chunk_size]
+        if chunk_id == b"fmt ":
+            format_tag, channels, sample_rate = struct.unpack("<HHI", body[:8])
+            bits = struct.unpack("<H", body[14:16])[0]
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                format_tag = struct.unpack("<H", body[24:26])[0]  # first two bytes of the sub-format GUID
+            fmt = (format_tag, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            # Streaming encoders may leave the size as 0 because it wasn't known up front
+            pcm = body if chunk_size else data[offset + 8:]
+            break
+        offset += 8 + chunk_size + (chunk_size & 1)  # chunks are word aligned
+
+    if fmt is None or pcm is None:
+        raise AudioDecodeError("WAV file has no fmt or data chunk")
+
+    format_tag, channels, sample_rate, bits = fmt
+    if channels < 1 or sample_rate < 1:
+        raise AudioDecodeError("WAV header is invalid")
+    width = bits // 8
+    usable = len(pcm) - len(pcm) % (width * channels)
+    pcm = pcm[:usable]
+
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and width in (4, 8):
+        samples = np.frombuffer(pcm, dtype="<f4" if width == 4 else "<f8").astype(np.float32)
+    elif format_tag == WAVE_FORMAT_PCM and width == 1:
+        samples = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif format_tag == WAVE_FORMAT_PCM and width == 2:
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768
+    elif format_tag == WAVE_FORMAT_PCM and width == 3:
+        raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        samples = values.astype(np.float32) / (1 << 23)
+    elif format_tag == WAVE_FORMAT_PCM and width == 4:
+        samples = np.frombuffer(pcm, dtype="<i4").astype(np.float32) / (1 << 31)
+    else:
+        raise AudioDecodeError(f"Unsupported WAV encoding (format {format_tag}, {bits} bits)")
+
+    return samples.reshape(-1, channels), sample_rate
+
+
+def to_mono(samples):
+    """Down-mix (frames, channels) samples to a mono array"""
+    return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+
+
+def resample(samples, source_rate, target_rate):
+    """Resample mono samples with linear interpolation (plenty for speech recognition)"""
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < source_rate:
+        # Box filter over the decimation ratio to keep aliasing down
+        window = int(round(source_rate / target_rate))
+        if window > 1:
+            samples = np.convolve(samples, np.ones(window, dtype=np.float32) / window, mode="same")
+    duration = len(samples) / source_rate
+    target_length = int(round(duration * target_rate))
+    source_positions = np.arange(len(samples)) / source_rate
+    target_positions = np.arange(target_length) / target_rate
+    return np.interp(target_positions, source_positions, samples).astype(np.float32)
+
+
+def trim_silence(samples, sample_rate):
+    """Cut leading and trailing silence using frame energy; returns an empty array if there is no speech"""
+    frame = max(1, sample_rate * VAD_FRAME_MS // 1000)
+    frame_count = len(samples) // frame
+    if frame_count == 0:
+        return samples[:0]
+
+    frames = samples[:frame_count * frame].reshape(frame_count, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    noise_floor = np.percentile(rms, 10)
+    # Speech must stand out from the noise floor; capping at half the peak keeps
+    # clips with no pauses (and so no quiet frames to measure) from being dropped
+    threshold = max(VAD_MIN_RMS, min(noise_floor * VAD_NOISE_FACTOR, rms.max() * 0.5))
+    voiced = np.nonzero(rms > threshold)[0]
+    if len(voiced) == 0:
+        return samples[:0]
+
+    padding = sample_rate * VAD_PADDING_MS // 1000
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return samples[start:end]
+
+
+def prepare_for_recognition(audio_bytes, target_rate=16000, fallback_rate=16000):
+    """Turn recorder output into trimmed mono 16-bit PCM at target_rate
+
+    Returns the PCM bytes, which are empty if the clip contains no speech.
+    Input without a WAV header is treated as raw 16-bit mono PCM at
+    fallback_rate.
+    """
+    if audio_bytes[:4] == b"RIFF":
+        samples, sample_rate = decode_wav(audio_bytes)
+        samples = to_mono(samples)
+    else:
+        usable = len(audio_bytes) - len(audio_bytes) % 2
+        samples = np.frombuffer(audio_bytes[:usable], dtype="<i2").astype(np.float32) / 32768
+        sample_rate = fallback_rate
+
+    samples = resample(samples, sample_rate, target_rate)
+    samples = trim_silence(samples, target_rate)
+    return to_pcm16(samples)
+
+
+def to_pcm16(samples):
+    """Convert float samples in [-1, 1] to little-endian 16-bit PCM bytes"""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+class EndpointDetector:
+    """Detects pauses and the end of speech in a live stream of mono samples
+
+    update() is fed consecutive chunks (typically 10-30 ms) and returns
+    "pause" once a short silence follows speech, "end" once the silence has
+    lasted long enough to count as end of utterance, and None otherwise.
+    """
+
+    def __init__(self, sample_rate, pause_ms=300, end_ms=1200):
+        self.sample_rate = sample_rate
+        self.pause_samples = sample_rate * pause_ms // 1000
+        self.end_samples = sample_rate * end_ms // 1000
+        self.noise_floor = VAD_MIN_RMS / VAD_NOISE_FACTOR
+        self.in_speech = False  # speech heard since the last pause
+        self.heard_speech = False  # speech heard at all in this utterance
+        self.silence = 0  # samples of silence since the last speech chunk
+        self._paused = False
+
+    def update(self, samples):
+        if len(samples) == 0:
+            return None
+        rms = float(np.sqrt(np.mean(samples ** 2)))
+        if rms > max(VAD_MIN_RMS, self.noise_floor * VAD_NOISE_FACTOR):
+            self.in_speech = True
+            self.heard_speech = True
+            self.silence = 0
+            self._paused = False
+            return None
+
+        # Track background noise slowly so a noisy room doesn't read as speech
+        self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        if not self.heard_speech:
+            return None
+        self.silence += len(samples)
+        if self.silence >= self.end_samples:
+            return "end"
+        if self.silence >= self.pause_samples and not self._paused:
+            self._paused = True
+            self.in_speech = False
+            return "pause"
+        return None
+
+
+def frame_to_mono(frame):
+    """Convert a PyAV audio frame (as delivered by streamlit-webrtc) to mono float samples"""
+    samples = frame.to_ndarray()
+    channels = len(frame.layout.channels)
+    if frame.format.is_planar:
+        samples = samples.T  # (channels, frames) -> (frames, channels)
+    else:
+        samples = samples.reshape(-1, channels)  # interleaved
+    samples = samples.astype(np.float32)
+    if frame.format.name.startswith("s16"):
+        samples /= 32768
+    elif frame.format.name.startswith("s32"):
+        samples /= 1 << 31
+    return to_mono(samples)
@@ -0,0 +1,95 @@
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from audio_encoding import audio_encoder, audio_format
+from tts_cache import audio_cache
+
+# Serve cached audio at http://0.0.0.0:<AUDIO_SERVER_PORT>/audio/<cache key>.<extension> when set
+AUDIO_SERVER_PORT = os.getenv("AUDIO_SERVER_PORT")
+
+# Address of the audio server as seen from the browser (e.g. behind a reverse proxy)
+AUDIO_BASE_URL = os.getenv("AUDIO_BASE_URL") or (
+    f"http://localhost:{AUDIO_SERVER_PORT}" if AUDIO_SERVER_PORT else None
+)
+
+AUDIO_PATH = re.compile(r"^/audio/([0-9a-f]{64})\.(?:mp3|ogg|wav)$")
+AUDIO_EXTENSIONS = {"audio/mpeg": "mp3", "audio/ogg": "ogg", "audio/wav": "wav"}
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class _AudioHandler(BaseHTTPRequestHandler):
+    """Serves cached audio and its encoded variants by key; entries never change, so browsers may cache them forever"""
+
+    def do_GET(self):
+        match = AUDIO_PATH.match(self.path.split("?")[0])
+        audio_bytes = None
+        if match:
+            # Keys are either synthesized audio or one of its encoded variants
+            store = audio_cache if match.group(1) in audio_cache else audio_encoder.store
+            audio_bytes = store.get(match.group(1))
+        if audio_bytes is None:
+            self.send_error(404)
+            return
+
+        # Single byte ranges, so players can seek without downloading the whole reply
+        start, end = 0, len(audio_bytes) - 1
+        byte_range = RANGE_HEADER.match(self.headers.get("Range", ""))
+        if byte_range and (byte_range.group(1) or byte_range.group(2)):
+            if byte_range.group(1):
+                start = int(byte_range.group(1))
+                if byte_range.group(2):
+                    end = min(end, int(byte_range.group(2)))
+            else:
+                start = max(0, len(audio_bytes) - int(byte_range.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(audio_bytes)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(audio_bytes)}")
+        else:
+            self.send_response(200)
+
+        body = audio_bytes[start:end + 1]
+        self.send_header("Content-Type", audio_format(audio_bytes))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Every play would otherwise be logged to the console
+
+
+_server = None
+_server_error = None
+_server_lock = threading.Lock()
+
+
+def start_audio_server(port):
+    """Serve cached audio on port from a background thread (once per process)
+
+    Returns the server, or None if the port could not be bound; the page then
+    falls back to sending audio bytes itself.
+    """
+    global _server, _server_error
+    with _server_lock:
+        if _server is None and _server_error is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _AudioHandler)
+            except OSError as e:
+                _server_error = e
+                return None
+            threading.Thread(target=_server.serve_forever, name="audio-http", daemon=True).start()
+        return _server
+
+
+def audio_url(cache_key, mime_type="audio/mpeg"):
+    """URL of a cached audio entry, or None when audio is not served by reference"""
+    if _server is None or AUDIO_BASE_URL is None:
+        return None
+    return f"{AUDIO_BASE_URL.rstrip('/')}/audio/{cache_key}.{AUDIO_EXTENSIONS[mime_type]}"
@@ -0,0 +1,85 @@
+"""Utterances with the command they should resolve to (None = an ordinary message for Gemini)
+
+Covers every supported language, punctuation and casing noise, missing
+accents, speech recognition near-misses, and sentences that merely contain a
+command word.
+"""
+
+COMMAND_CORPUS = [
+    # English commands
+    ("English", "clear chat", "clear_chat"),
+    ("English", "Clear the chat.", "clear_chat"),
+    ("English", "Please reset chat!", "clear_chat"),
+    ("English", "new chat please", "clear_chat"),
+    ("English", "Change personality", "change_personality"),
+    ("English", "could you switch mode", "change_personality"),
+    ("English", "speak faster", "speak_faster"),
+    ("English", "Faster!", "speak_faster"),
+    ("English", "ok speed up", "speak_faster"),
+    ("English", "speak slower please", "speak_slower"),
+    ("English", "slow down", "speak_slower"),
+    ("English", "speak lower", "speak_slower"),
+    ("English", "show command", "help"),
+    ("English", "Help", "help"),
+    ("English", "help?", "help"),
+    ("English", "What can you do?", "help"),
+    ("English", "show commands", "help"),
+    # English messages that only contain command words
+    ("English", "Can you help me with my homework?", None),
+    ("English", "I want to run faster in my next race", None),
+    ("English", "How do I clear my browser history?", None),
+    ("English", "What are the best commands in Linux?", None),
+    ("English", "Tell me a joke about a slower turtle", None),
+    ("English", "The new chat app is great, what do you think?", None),
+    ("English", "helpful", None),
+    ("English", "hello", None),
+    # Near-misses of destructive or unrelated commands are ordinary messages
+    ("English", "clear chad", None),
+    ("English", "clear that", None),
+    ("English", "reset chart", None),
+    ("English", "new chats", None),
+    ("English", "clear the cat", None),
+    ("English", "start overs", None),
+    ("English", "what can I do", None),
+    # Spanish
+    ("Spanish", "borrar el historial", "clear_chat"),
+    ("Spanish", "Nueva conversación, por favor", "clear_chat"),
+    ("Spanish", "cambiar de personalidad", "change_personality"),
+    ("Spanish", "habla más rápido", "speak_faster"),
+    ("Spanish", "habla mas rapido", "speak_faster"),
+    ("Spanish", "Más despacio, por favor.", "speak_slower"),
+    ("Spanish", "ayuda", "help"),
+    ("Spanish", "¿Qué puedes hacer?", "help"),
+    ("Spanish", "clear chat", "clear_chat"),
+    ("Spanish", "¿Me ayudas con la tarea?", None),
+    ("Spanish", "Quiero correr más rápido", None),
+    # French
+    ("French", "Effacer la conversation", "clear_chat"),
+    ("French", "nouvelle conversation s'il te plaît", "clear_chat"),
+    ("French", "changer de personnalité", "change_personality"),
+    ("French", "parle plus vite", "speak_faster"),
+    ("French", "Parlez plus lentement, s'il vous plaît", "speak_slower"),
+    ("French", "aide", "help"),
+    ("French", "Que peux-tu faire ?", "help"),
+    ("French", "Peux-tu m'aider avec mes devoirs ?", None),
+    ("French", "Je veux apprendre à parler plus vite en anglais", None),
+    # Chinese
+    ("Chinese", "清除聊天记录", "clear_chat"),
+    ("Chinese", "请清空聊天。", "clear_chat"),
+    ("Chinese", "切换性格", "change_personality"),
+    ("Chinese", "说快一点", "speak_faster"),
+    ("Chinese", "说 慢 一点 吧", "speak_slower"),
+    ("Chinese", "帮助", "help"),
+    ("Chinese", "你能做什么？", "help"),
+    ("Chinese", "请帮助我写一篇作文", None),
+    ("Chinese", "我想跑得快一点", None),
+    # Japanese
+    ("Japanese", "チャットをクリアして", "clear_chat"),
+    ("Japanese", "性格を変えて", "change_personality"),
+    ("Japanese", "もっと速く話して", "speak_faster"),
+    ("Japanese", "ゆっくり話してください", "speak_slower"),
+    ("Japanese", "ヘルプ！", "help"),
+    ("Japanese", "ＨＥＬＰ", "help"),
+    ("Japanese", "宿題を手伝ってください", None),
+    ("Japanese", "ゆっくり話す練習をしたいです", None),
+]
@@ -0,0 +1,181 @@
+import asyncio
+import contextlib
+import random
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+
+class FakeConfig:
+    """Latency (seconds) and failure injection settings for the fake backends"""
+
+    def __init__(self, gemini_latency=0.3, gemini_chunk_latency=0.02, gemini_failure_rate=0.0,
+                 tts_latency=0.2, tts_char_latency=0.001, tts_rate_limit_rate=0.0,
+                 stt_latency=0.25, stt_failure_rate=0.0, seed=1234):
+        self.gemini_latency = gemini_latency  # until the first token
+        self.gemini_chunk_latency = gemini_chunk_latency  # between streamed chunks
+        self.gemini_failure_rate = gemini_failure_rate
+        self.tts_latency = tts_latency
+        self.tts_char_latency = tts_char_latency
+        self.tts_rate_limit_rate = tts_rate_limit_rate  # fraction of TTS calls answered with a 429
+        self.stt_latency = stt_latency
+        self.stt_failure_rate = stt_failure_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def roll(self, rate):
+        """Deterministically decide whether to inject a failure"""
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def as_dict(self):
+        return {k: v for k, v in vars(self).items() if not k.startswith("_")}
+
+
+class FakeUpstreamError(Exception):
+    pass
+
+
+def fake_reply(prompt):
+    """Deterministic multi-sentence reply of realistic length"""
+    return (
+        f"You said: {prompt}. Here is a detailed answer that covers the main points. "
+        "First, consider the background and why it matters. "
+        "Second, look at a concrete example to make the idea clearer. "
+        "Finally, remember to review what you learned and ask follow-up questions."
+    )
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_token_count):
+        self.prompt_token_count = prompt_token_count
+
+
+class _Response:
+    def __init__(self, text, prompt_tokens, config):
+        self.text = text
+        self.usage_metadata = _UsageMetadata(prompt_tokens)
+        self._config = config
+        self._chunks = [text[i:i + 40] for i in range(0, len(text), 40)]
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            time.sleep(self._config.gemini_chunk_latency)
+            yield _Chunk(chunk)
+
+    def __aiter__(self):
+        return self._async_chunks()
+
+    async def _async_chunks(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._config.gemini_chunk_latency)
+            yield _Chunk(chunk)
+
+
+class FakeChatSession:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+
+    def _reply(self, prompt):
+        if self.model.config.roll(self.model.config.gemini_failure_rate):
+            raise FakeUpstreamError("503 Service Unavailable (injected)")
+        prompt_tokens = sum(len(str(part)) // 4 for msg in self.history for part in msg["parts"]) + len(prompt) // 4
+        text = fake_reply(prompt)
+        self.history.append({"role": "user", "parts": [prompt]})
+        self.history.append({"role": "model", "parts": [text]})
+        return _Response(text, prompt_tokens, self.model.config)
+
+    def send_message(self, prompt, stream=False):
+        time.sleep(self.model.config.gemini_latency)
+        return self._reply(prompt)
+
+    async def send_message_async(self, prompt, stream=False):
+        await asyncio.sleep(self.model.config.gemini_latency)
+        return self._reply(prompt)
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel"""
+
+    config = FakeConfig()
+
+    def __init__(self, model_name, system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.config.gemini_latency)
+        return _Response(f"Summary of {len(prompt)} characters of conversation.", len(prompt) // 4, self.config)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(self.config.gemini_latency)
+        return _Response(f"Summary of {len(prompt)} characters of conversation.", len(prompt) // 4, self.config)
+
+    async def count_tokens_async(self, contents, **kwargs):
+        await asyncio.sleep(self.config.gemini_latency)
+        return SimpleNamespace(total_tokens=len(contents) // 4)
+
+
+class FakeGTTS:
+    """Stands in for gtts.gTTS; writes a deterministic fake MP3 payload"""
+
+    config = FakeConfig()
+
+    def __init__(self, text, lang="en", slow=False, tld="com", **kwargs):
+        self.text = text
+        self.lang = lang
+        self.slow = slow
+        self.tld = tld
+
+    def write_to_fp(self, fp):
+        time.sleep(self.config.tts_latency + self.config.tts_char_latency * len(self.text))
+        if self.config.roll(self.config.tts_rate_limit_rate):
+            raise FakeUpstreamError("429 (Too Many Requests) from TTS API (injected)")
+        # Roughly 1 KB of "audio" per 10 characters, like real speech at 32 kbps
+        header = f"FAKE-MP3|{self.lang}|{self.tld}|{self.slow}|".encode()
+        fp.write(header + self.text.encode() * 100)
+
+
+def fake_recognize_google(config):
+    """Build a replacement for sr.Recognizer.recognize_google"""
+    import speech_recognition as sr
+
+    def recognize_google(self, audio_data, key=None, language="en-US", **kwargs):
+        time.sleep(config.stt_latency)
+        if config.roll(config.stt_failure_rate):
+            raise sr.RequestError("recognition connection failed (injected)")
+        seconds = len(audio_data.get_raw_data()) / (audio_data.sample_rate * audio_data.sample_width)
+        return f"what is the capital of france ({seconds:.1f} seconds)"
+
+    return recognize_google
+
+
+@contextlib.contextmanager
+def patched_backends(config):
+    """Replace Gemini, gTTS and Google STT with the fakes for the duration of the block"""
+    import google.generativeai as genai
+    import gtts
+    import speech_recognition as sr
+
+    import gemini_chat
+
+    FakeGenerativeModel.config = config
+    FakeGTTS.config = config
+    with mock.patch.object(genai, "GenerativeModel", FakeGenerativeModel), \
+            mock.patch.object(gtts, "gTTS", FakeGTTS), \
+            mock.patch.object(sr.Recognizer, "recognize_google", fake_recognize_google(config)), \
+            mock.patch.dict(gemini_chat._models, clear=True):
+        yield
@@ -0,0 +1,349 @@
+"""Benchmark the voice assistant against local stand-ins for Gemini, gTTS and Google STT
+
+Usage:
+    python benchmarks/run.py --output bench_results.json
+    python benchmarks/run.py --only turn_latency concurrent_sessions --sessions 50
+
+Results are written as JSON so runs can be compared between commits.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000 if ordered else None,
+        "p50_ms": ordered[len(ordered) // 2] * 1000 if ordered else None,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000 if ordered else None,
+        "max_ms": ordered[-1] * 1000 if ordered else None,
+    }
+
+
+def make_wav(seconds=2.0, rate=16000):
+    """A recorder-like WAV clip: silence, a voiced tone, silence"""
+    import numpy as np
+
+    t = np.arange(int(seconds * rate)) / rate
+    voiced = (t > seconds * 0.25) & (t < seconds * 0.75)
+    samples = np.where(voiced, 0.3 * np.sin(2 * np.pi * 180 * t), 0.0005 * np.sin(2 * np.pi * 50 * t))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((samples * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def bench_turn_latency(args):
+    """End-to-end latency of one voice turn: transcribe, respond, synthesize"""
+    from engine import get_engine
+
+    engine = get_engine()
+    clip = make_wav()
+
+    async def run():
+        session = engine.create_session()
+        stages = {"transcribe": [], "respond": [], "first_chunk": [], "synthesize": [], "turn": []}
+        for i in range(args.turns):
+            start = time.perf_counter()
+            text, _ = await engine.transcribe(session, clip)
+            stages["transcribe"].append(time.perf_counter() - start)
+
+            mark = time.perf_counter()
+            engine.submit_message(session, f"{text} #{i}")
+            first_chunk = None
+            async for _ in engine.respond_stream(session):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - mark
+            stages["first_chunk"].append(first_chunk)
+            stages["respond"].append(time.perf_counter() - mark)
+
+            mark = time.perf_counter()
+            await engine.synthesize(session, session.messages[-1]["content"])
+            stages["synthesize"].append(time.perf_counter() - mark)
+            stages["turn"].append(time.perf_counter() - start)
+        return {name: summarize(samples) for name, samples in stages.items()}
+
+    return asyncio.run(run())
+
+
+def bench_rerun_render(args):
+    """Streamlit page rerun time as the transcript grows (audio already cached)"""
+    from streamlit.testing.v1 import AppTest
+
+    from engine import Session
+    from fakes import fake_reply
+
+    results = []
+    for length in args.transcript_lengths:
+        session = Session()
+        for i in range(length // 2):
+            session.messages.append({"role": "user", "content": f"Question number {i}?"})
+            session.messages.append({"role": "model", "content": fake_reply(f"Question number {i}?")})
+
+        # Warm the audio cache so only rendering is measured
+        from engine import get_engine
+        for message in session.messages:
+            if message["role"] == "model":
+                get_engine().submit_synthesis(session, message["content"], block=True).result()
+
+        app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+        app.session_state["session"] = session
+        app.run()  # First run pays for imports and widget setup
+        samples = []
+        for _ in range(args.reruns):
+            start = time.perf_counter()
+            app.run()
+            samples.append(time.perf_counter() - start)
+        results.append({"messages": length, **summarize(samples)})
+    return results
+
+
+def bench_tts_throughput(args):
+    """Characters per second synthesized through the worker pool on a cold cache"""
+    from engine import get_engine
+
+    engine = get_engine()
+    session = engine.create_session()
+    texts = [f"{i}: " + " ".join(["This is sentence number %d of the throughput test." % j for j in range(4)])
+             for i in range(args.tts_jobs)]
+
+    start = time.perf_counter()
+    futures = [engine.submit_synthesis(session, text, block=True) for text in texts]
+    results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    chars = sum(len(text) for text in texts)
+    failures = sum(1 for audio_bytes, _ in results if audio_bytes is None)
+
+    # Same texts again: every job should now be a cache hit
+    start = time.perf_counter()
+    for text in texts:
+        engine.submit_synthesis(session, text, block=True).result()
+    cached_elapsed = time.perf_counter() - start
+
+    return {
+        "jobs": len(texts),
+        "characters": chars,
+        "seconds": elapsed,
+        "chars_per_second": chars / elapsed,
+        "failures": failures,
+        "cached_seconds": cached_elapsed,
+        "cached_chars_per_second": chars / cached_elapsed if cached_elapsed else None,
+    }
+
+
+def bench_concurrent_sessions(args):
+    """N simulated users doing full voice turns at once on one event loop"""
+    from engine import get_engine
+    from gemini_chat import resilience_stats
+
+    engine = get_engine()
+    clip = make_wav()
+
+    async def user(index):
+        session = engine.create_session()
+        durations = []
+        errors = 0
+        for turn in range(args.turns_per_session):
+            start = time.perf_counter()
+            text, error = await engine.transcribe(session, clip)
+            if error:
+                errors += 1
+                text = "fallback question"
+            reply = await engine.ask(session, f"{text} (user {index}, turn {turn})")
+            if session.last_error is not None:
+                errors += 1  # The turn failed and the engine handed the prompt back
+            audio_bytes, _ = await engine.synthesize(session, reply)
+            if audio_bytes is None:
+                errors += 1
+            durations.append(time.perf_counter() - start)
+        return durations, errors
+
+    async def run():
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(user(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+        durations = [d for session_durations, _ in outcomes for d in session_durations]
+        return {
+            "sessions": args.sessions,
+            "turns": len(durations),
+            "seconds": elapsed,
+            "turns_per_second": len(durations) / elapsed,
+            "errors": sum(errors for _, errors in outcomes),
+            "turn_latency": summarize(durations),
+            "gemini": resilience_stats(),
+        }
+
+    return asyncio.run(run())
+
+
+def bench_command_matching(args):
+    """Accuracy and per-utterance latency of the voice command matcher on the corpus"""
+    from command_corpus import COMMAND_CORPUS
+    from commands import parse_command
+
+    mismatches = [
+        {"language": language, "text": text, "expected": expected, "got": parse_command(text, language)}
+        for language, text, expected in COMMAND_CORPUS
+        if parse_command(text, language) != expected
+    ]
+
+    samples = []
+    for _ in range(args.command_rounds):
+        for language, text, _ in COMMAND_CORPUS:
+            start = time.perf_counter()
+            parse_command(text, language)
+            samples.append(time.perf_counter() - start)
+    latency = summarize(samples)
+
+    return {
+        "utterances": len(COMMAND_CORPUS),
+        "accuracy": 1 - len(mismatches) / len(COMMAND_CORPUS),
+        "mismatches": mismatches,
+        "commands_resolved_locally": sum(1 for _, _, expected in COMMAND_CORPUS if expected),
+        # Milliseconds are too coarse here, so report microseconds
+        "mean_us": latency["mean_ms"] * 1000,
+        "p95_us": latency["p95_ms"] * 1000,
+    }
+
+
+# Runs in a fresh interpreter, so every import is a cold one
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import engine
+imported = time.perf_counter()
+app_engine = engine.get_engine()
+created = time.perf_counter()
+sdk_loaded = "google.generativeai" in sys.modules
+engine.run_sync(app_engine.warm_up(connect=False))
+warmed = time.perf_counter()
+engine.run_sync(app_engine.warm_up(connect=False))
+print(json.dumps({
+    "import": imported - start,
+    "engine": created - imported,
+    "warm_up": warmed - created,
+    "warm_up_again": time.perf_counter() - warmed,
+    "sdk_loaded_at_import": sdk_loaded,
+}))
+"""
+
+
+def bench_cold_start(args):
+    """Process cold start: importing the engine, creating it and warming it up (no network)"""
+    runs = []
+    for _ in range(args.cold_start_runs):
+        output = subprocess.check_output(
+            [sys.executable, "-W", "ignore", "-c", COLD_START_SCRIPT], cwd=ROOT, text=True,
+            stderr=subprocess.DEVNULL,
+        )
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    result = {
+        stage: summarize([run[stage] for run in runs])
+        for stage in ("import", "engine", "warm_up", "warm_up_again")
+    }
+    # The Gemini SDK should only be loaded by the warm-up or the first turn
+    result["sdk_loaded_at_import"] = any(run["sdk_loaded_at_import"] for run in runs)
+    return result
+
+
+BENCHMARKS = {
+    "turn_latency": bench_turn_latency,
+    "rerun_render": bench_rerun_render,
+    "tts_throughput": bench_tts_throughput,
+    "concurrent_sessions": bench_concurrent_sessions,
+    "command_matching": bench_command_matching,
+    "cold_start": bench_cold_start,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--turns", type=int, default=10, help="turns for turn_latency")
+    parser.add_argument("--transcript-lengths", type=int, nargs="+", default=[0, 10, 50, 100])
+    parser.add_argument("--reruns", type=int, default=5, help="timed reruns per transcript length")
+    parser.add_argument("--tts-jobs", type=int, default=40)
+    parser.add_argument("--sessions", type=int, default=20, help="users for concurrent_sessions")
+    parser.add_argument("--turns-per-session", type=int, default=3)
+    parser.add_argument("--cold-start-runs", type=int, default=5, help="fresh processes for cold_start")
+    parser.add_argument("--command-rounds", type=int, default=200, help="passes over the command corpus")
+    parser.add_argument("--gemini-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--tts-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--stt-latency", type=float, default=0.25)
+    parser.add_argument("--stt-failure-rate", type=float, default=0.0)
+    parser.add_argument("--tts-rate-per-sec", type=float, help="override the shared gTTS rate limit")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    # Isolated cache and no real network; must be set before the app modules are imported
+    os.environ["TTS_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-tts-cache-")
+    os.environ["CONVERSATION_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench-conversations-"), "bench.db")
+    os.environ["AUDIO_CODEC"] = "none"  # The fake audio can't be decoded for transcoding
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    if args.tts_rate_per_sec:
+        os.environ["TTS_RATE_PER_SEC"] = str(args.tts_rate_per_sec)
+
+    from fakes import FakeConfig, patched_backends
+
+    config = FakeConfig(
+        gemini_latency=args.gemini_latency,
+        gemini_failure_rate=args.gemini_failure_rate,
+        tts_latency=args.tts_latency,
+        tts_rate_limit_rate=args.tts_rate_limit_rate,
+        stt_latency=args.stt_latency,
+        stt_failure_rate=args.stt_failure_rate,
+        seed=args.seed,
+    )
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fake_backends": config.as_dict(),
+        "results": {},
+    }
+    with patched_backends(config):
+        for name in args.only or list(BENCHMARKS):
+            print(f"Running {name}...", file=sys.stderr)
+            start = time.perf_counter()
+            report["results"][name] = BENCHMARKS[name](args)
+            print(f"  done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
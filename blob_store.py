@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+class BlobStore:
+    """Disk-backed blob store with a byte cap and LRU eviction
+
+    Blobs live in files, not in process memory, so only their keys and sizes
+    need to be kept by whoever stored them.
+    """
+
+    def __init__(self, directory, max_bytes, extension=".bin"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def fingerprint(data):
+        """Content hash used as the key for a blob"""
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.extension}")
+
+    def _load_index(self):
+        """Rebuild the LRU order from files left by a previous process"""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.extension):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            files.append((stat.st_mtime, name[:-len(self.extension)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """Return the blob stored under key, or None on a miss"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                # File removed behind our back, forget about it
+                self.total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            os.utime(self._path(key))
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store data under key, evicting old entries to stay under the cap"""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Return counters for display and monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Recent voice recordings, keyed by fingerprint, so sessions keep only digests
+recording_store = BlobStore(
+    os.getenv("RECORDING_DIR", ".recordings"),
+    int(os.getenv("RECORDING_MAX_BYTES", str(50 * 1024 * 1024))),
+    extension=".wav",
+)
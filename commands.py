@@ -0,0 +1,185 @@
+import re
+import unicodedata
+
+HELP_TEXT = """📋 **Available Voice Commands:**
+
+- **"clear chat"** - Clear conversation history
+- **"change personality"** - Switch AI personality
+- **"speak faster"** - Increase TTS speed
+- **"speak slower"** - Decrease TTS speed
+- **"help"** - Show this command list
+
+You can also use natural variations like "reset chat", "speed up", etc.
+Commands work in your selected language too, e.g. "ayuda", "aide", "帮助" or "ヘルプ"."""
+
+# Spoken aliases of each command, per language. Matching is anchored: the whole
+# utterance (apart from filler words like "please") must be an alias, so "help"
+# or "faster" inside a normal sentence is never taken as a command. English
+# aliases are accepted whatever the selected language.
+COMMAND_ALIASES = {
+    "English": {
+        "clear_chat": ["clear chat", "clear the chat", "clear history", "clear the history", "clear chat history",
+                       "reset chat", "reset the chat", "new chat", "new conversation", "start over"],
+        "change_personality": ["change personality", "switch personality", "change mode", "switch mode",
+                               "change your personality"],
+        "speak_faster": ["speak faster", "speed up", "faster", "talk faster", "speak more quickly", "go faster"],
+        "speak_slower": ["speak slower", "slow down", "slower", "talk slower", "speak more slowly", "speak slowly",
+                         "talk slowly"],
+        "help": ["help", "show commands", "what can you do", "commands", "list commands", "what are the commands"],
+    },
+    "Spanish": {
+        "clear_chat": ["borrar chat", "borrar el chat", "borrar historial", "borrar el historial", "limpiar chat",
+                       "limpiar el chat", "nuevo chat", "nueva conversación", "reiniciar chat", "empezar de nuevo"],
+        "change_personality": ["cambiar personalidad", "cambiar de personalidad", "cambiar modo", "cambiar de modo"],
+        "speak_faster": ["habla más rápido", "más rápido", "hablar más rápido", "acelera"],
+        "speak_slower": ["habla más despacio", "habla más lento", "más despacio", "más lento", "hablar más despacio"],
+        "help": ["ayuda", "comandos", "mostrar comandos", "qué puedes hacer"],
+    },
+    "French": {
+        "clear_chat": ["effacer le chat", "effacer la discussion", "effacer la conversation", "effacer l'historique",
+                       "nouvelle conversation", "nouvelle discussion", "réinitialiser la conversation",
+                       "recommencer"],
+        "change_personality": ["changer de personnalité", "changer la personnalité", "changer de mode"],
+        "speak_faster": ["parle plus vite", "parlez plus vite", "plus vite", "accélère"],
+        "speak_slower": ["parle plus lentement", "parlez plus lentement", "plus lentement", "moins vite",
+                         "ralentis"],
+        "help": ["aide", "aide-moi", "commandes", "afficher les commandes", "que peux-tu faire"],
+    },
+    "Chinese": {
+        "clear_chat": ["清除聊天", "清空聊天", "清除聊天记录", "清空聊天记录", "清除记录", "新对话", "重新开始"],
+        "change_personality": ["切换性格", "更换性格", "换个性格", "切换角色", "更换角色", "切换模式"],
+        "speak_faster": ["说快一点", "说快点", "快一点", "快点说", "加快语速"],
+        "speak_slower": ["说慢一点", "说慢点", "慢一点", "慢点说", "放慢语速"],
+        "help": ["帮助", "命令", "显示命令", "你能做什么"],
+    },
+    "Japanese": {
+        "clear_chat": ["チャットをクリア", "チャットをクリアして", "履歴を消して", "履歴を削除", "新しい会話",
+                       "最初からやり直して"],
+        "change_personality": ["性格を変えて", "性格を変更", "モードを変えて", "モードを変更"],
+        "speak_faster": ["速く話して", "もっと速く話して", "早く話して", "もっと早く話して", "速くして"],
+        "speak_slower": ["ゆっくり話して", "もっとゆっくり話して", "ゆっくりして", "遅く話して"],
+        "help": ["ヘルプ", "コマンド", "コマンド一覧", "何ができるの"],
+    },
+}
+
+# Polite or filler words allowed around a command ("please speak slower", "ok help")
+FILLER_WORDS = {
+    "English": ["please", "hey", "ok", "okay", "now", "can you", "could you", "would you", "assistant"],
+    "Spanish": ["por favor", "oye", "puedes", "podrías", "ahora", "vale"],
+    "French": ["s'il te plaît", "s'il vous plaît", "peux-tu", "pouvez-vous", "maintenant", "d'accord"],
+    "Chinese": ["请", "请你", "麻烦", "一下", "吧", "好吗"],
+    "Japanese": ["ください", "下さい", "お願い", "お願いします"],
+}
+
+# Near-misses from speech recognition ("speak lower") still match a multi-word
+# alias when a single word is one character off and that word is at least this long
+FUZZY_MIN_WORD_CHARS = 4
+
+# Commands that must be said exactly: a near-miss of these is an ordinary sentence
+# as often as not ("clear that", "new chats"), and wrongly running them loses the history
+EXACT_ONLY_COMMANDS = {"clear_chat"}
+
+# Chinese and Japanese characters, which are written without spaces between words
+CJK_SPACE = re.compile(r"(?<=[\u3040-\u30ff\u3400-\u9fff])\s+(?=[\u3040-\u30ff\u3400-\u9fff])")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Canonical form for matching: lowercase, no accents or punctuation, single spaces
+
+    Full-width characters are folded to their ASCII forms, and spaces that
+    speech recognition puts between Chinese/Japanese characters are removed.
+    """
+    text = unicodedata.normalize("NFKD", unicodedata.normalize("NFKC", text).lower())
+    # Only Latin accents are dropped; kana voicing marks are combining characters too
+    text = "".join(
+        " " if unicodedata.category(ch)[0] in "PS" else ch
+        for ch in text
+        if not "\u0300" <= ch <= "\u036f"
+    )
+    text = unicodedata.normalize("NFC", WHITESPACE.sub(" ", text).strip())
+    return CJK_SPACE.sub("", text)
+
+
+class CommandMatcher:
+    """Matches whole utterances against command aliases with one precompiled regex
+
+    Built once per language; matching an utterance is a single anchored regex
+    match, with a fallback for utterances one character away from an alias.
+    """
+
+    def __init__(self, alias_tables, filler_words):
+        self.aliases = {}  # normalized alias -> command
+        for table in alias_tables:
+            for command, aliases in table.items():
+                for alias in aliases:
+                    self.aliases[normalize(alias)] = command
+
+        commands = {}
+        for alias, command in self.aliases.items():
+            commands.setdefault(command, []).append(alias)
+        groups = "|".join(f"(?P<{command}>{self._alternation(aliases)})" for command, aliases in commands.items())
+        fillers = self._alternation(normalize(word) for word in filler_words)
+        self.pattern = re.compile(rf"^(?:(?:{fillers}) ?)*(?:{groups})(?: ?(?:{fillers}))*$")
+
+        # Anything longer can't be an alias plus a few fillers, and is rejected without normalizing
+        self.max_chars = 2 * max(len(alias) for alias in self.aliases) + 40
+        self._fuzzy_aliases = {}  # word count -> [(words, command)] of aliases near-misses may match
+        for alias, command in self.aliases.items():
+            words = alias.split(" ")
+            if command not in EXACT_ONLY_COMMANDS and len(words) > 1:
+                self._fuzzy_aliases.setdefault(len(words), []).append((words, command))
+
+    @staticmethod
+    def _alternation(phrases):
+        # Longest first, so a longer alias wins over its own prefix
+        return "|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+
+    def match(self, text):
+        """Return the command text consists of, or None"""
+        if len(text) > self.max_chars:
+            return None
+        normalized = normalize(text)
+        match = self.pattern.match(normalized)
+        if match:
+            return match.lastgroup
+        return self._near_miss(normalized.split(" "))
+
+    def _near_miss(self, words):
+        """Command of the alias that words match but for one character in one word, or None"""
+        for alias_words, command in self._fuzzy_aliases.get(len(words), []):
+            differing = [(word, alias_word) for word, alias_word in zip(words, alias_words) if word != alias_word]
+            if len(differing) == 1 and len(differing[0][1]) >= FUZZY_MIN_WORD_CHARS and _one_edit(*differing[0]):
+                return command
+        return None
+
+
+def _one_edit(a, b):
+    """True if b is a with exactly one character inserted, deleted or replaced"""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:] if len(a) < len(b) else a[i + 1:] == b[i + 1:]
+
+
+# One matcher per language, each accepting that language's aliases plus English
+_matchers = {
+    language: CommandMatcher(
+        [COMMAND_ALIASES["English"], aliases],
+        FILLER_WORDS["English"] + FILLER_WORDS.get(language, []),
+    )
+    for language, aliases in COMMAND_ALIASES.items()
+}
+
+
+# Function to parse voice commands
+def parse_command(text, language="English"):
+    """Parse user input for voice commands and return command type
+
+    Returns None if text is an ordinary message rather than a command.
+    """
+    return _matchers.get(language, _matchers["English"]).match(text)
@@ -0,0 +1,101 @@
+# Voice configurations
+VOICES = {
+    "Female": {
+        "name": "Female",
+        "icon": "👩",
+        "tld": "com",  # US English female voice
+        "espeak_variant": "f3",
+        "description": "Female voice"
+    },
+    "Male": {
+        "name": "Male",
+        "icon": "👨",
+        "tld": "co.uk",  # UK English male-like voice
+        "espeak_variant": "m3",
+        "description": "Male voice"
+    }
+}
+
+# Language configurations
+LANGUAGES = {
+    "English": {
+        "name": "English",
+        "flag": "🇺🇸",
+        "tts_code": "en",
+        "speech_code": "en-US",
+        "display_name": "English",
+        "stt_engine": "google",
+        "tts_engine": "gtts"
+    },
+    "Spanish": {
+        "name": "Spanish",
+        "flag": "🇪🇸",
+        "tts_code": "es",
+        "speech_code": "es-ES",
+        "display_name": "Español",
+        "stt_engine": "google",
+        "tts_engine": "gtts"
+    },
+    "French": {
+        "name": "French",
+        "flag": "🇫🇷",
+        "tts_code": "fr",
+        "speech_code": "fr-FR",
+        "display_name": "Français",
+        "stt_engine": "google",
+        "tts_engine": "gtts"
+    },
+    "Chinese": {
+        "name": "Chinese",
+        "flag": "🇨🇳",
+        "tts_code": "zh-CN",
+        "speech_code": "zh-CN",
+        "display_name": "中文",
+        "stt_engine": "google",
+        "tts_engine": "gtts"
+    },
+    "Japanese": {
+        "name": "Japanese",
+        "flag": "🇯🇵",
+        "tts_code": "ja",
+        "speech_code": "ja-JP",
+        "display_name": "日本語",
+        "stt_engine": "google",
+        "tts_engine": "gtts"
+    }
+}
+
+# Personality configurations
+PERSONALITIES = {
+    "General Assistant": {
+        "name": "General Assistant",
+        "emoji": "🤖",
+        "description": "A helpful AI assistant for general tasks and questions",
+        "system_prompt": "You are a helpful, friendly, and knowledgeable AI assistant. Provide clear, concise, and accurate responses to user queries."
+    },
+    "Study Buddy": {
+        "name": "Study Buddy",
+        "emoji": "📚",
+        "description": "An AI tutor to help with learning and studying",
+        "system_prompt": "You are an encouraging and patient study buddy. Help users learn by breaking down complex topics, providing explanations, and asking questions to reinforce understanding. Use analogies and examples to make concepts clearer."
+    },
+    "Fitness Coach": {
+        "name": "Fitness Coach",
+        "emoji": "💪",
+        "description": "A motivational fitness and wellness coach",
+        "system_prompt": "You are an enthusiastic and motivating fitness coach. Provide workout advice, nutrition tips, and encouragement. Be positive, supportive, and focus on healthy, sustainable habits. Always remind users to consult healthcare professionals for medical advice."
+    },
+    "Gaming Helper": {
+        "name": "Gaming Helper",
+        "emoji": "🎮",
+        "description": "A gaming companion for tips, strategies, and game discussions",
+        "system_prompt": "You are a knowledgeable and enthusiastic gaming companion. Help users with game strategies, tips, walkthroughs, and general gaming discussions. Be friendly and share in their excitement about games."
+    }
+}
+
+# Selector options and labels, derived once per process rather than on every rerun
+LANGUAGE_OPTIONS = list(LANGUAGES)
+LANGUAGE_LABELS = {name: f"{language['flag']} {language['display_name']}" for name, language in LANGUAGES.items()}
+VOICE_OPTIONS = list(VOICES)
+VOICE_LABELS = {name: f"{voice['icon']} {voice['name']}" for name, voice in VOICES.items()}
+PERSONALITY_OPTIONS = list(PERSONALITIES)
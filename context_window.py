@@ -0,0 +1,71 @@
+import os
+
+# Approximate prompt size (in tokens) of recent turns sent verbatim to Gemini
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+
+
+def estimate_tokens(text):
+    """Cheap token estimate: ~4 ASCII characters per token, one token per other character
+
+    Non-ASCII text (Chinese, Japanese, accented words) tokenizes much more
+    densely than English, so it is counted per character.
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def messages_tokens(messages):
+    """Estimate the tokens needed to send a list of chat messages"""
+    return sum(estimate_tokens(msg["content"]) for msg in messages)
+
+
+class ContextWindow:
+    """Keeps recent turns verbatim and folds older turns into a rolling summary
+
+    Messages are never removed from the transcript; the window only tracks how
+    many of the leading messages are represented by the summary instead.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary = ""
+        self.summarized_count = 0  # leading messages folded into the summary
+
+    def needs_compaction(self, messages):
+        """Return True if the unsummarized messages exceed the token budget"""
+        return messages_tokens(messages[self.summarized_count:]) > self.token_budget
+
+    def compact(self, messages, summarize):
+        """Fold older messages into the summary until the recent ones fit in half the budget
+
+        summarize(previous_summary, messages) must return the updated summary text.
+        Returns True if anything was folded.
+        """
+        keep_budget = self.token_budget // 2
+        recent_tokens = 0
+        split = len(messages)
+        # Walk backwards, keeping as many recent messages as fit; the kept part
+        # must start on a user message so roles still alternate after the summary
+        for i in range(len(messages) - 1, self.summarized_count - 1, -1):
+            recent_tokens += estimate_tokens(messages[i]["content"])
+            if recent_tokens > keep_budget:
+                break
+            if messages[i]["role"] == "user":
+                split = i
+
+        if split <= self.summarized_count:
+            return False
+
+        self.summary = summarize(self.summary, messages[self.summarized_count:split])
+        self.summarized_count = split
+        return True
+
+    def history(self, messages):
+        """Return the chat history to send: the summary (if any) followed by recent turns"""
+        history = []
+        if self.summary:
+            history.append({"role": "user", "parts": [f"Summary of our conversation so far:\n{self.summary}"]})
+            history.append({"role": "model", "parts": ["Understood, I'll keep that in mind."]})
+        for msg in messages[self.summarized_count:]:
+            history.append({"role": msg["role"], "parts": [msg["content"]]})
+        return history
@@ -0,0 +1,255 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from context_window import estimate_tokens
+
+# SQLite file holding every conversation; set to an empty string to keep conversations in memory only
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", "conversations.db")
+
+# Messages read from the store at a time when older history is needed
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    personality TEXT NOT NULL,
+    language TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    tts_speed INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    audio_key TEXT,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+);
+"""
+
+
+class ConversationStore:
+    """SQLite store for conversations and their messages
+
+    Writes are queued and committed in batches by a background thread, so
+    saving a message never adds latency to a turn. Reads wait for queued
+    writes first, so they always see everything appended so far.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=0.2):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # longest a write waits for others to batch with
+        self.batches = 0
+        self.writes = 0
+        self._writes = queue.Queue()
+        self._local = threading.local()
+        db = self._connect()
+        db.executescript(SCHEMA)
+        db.close()
+        threading.Thread(target=self._write_loop, name="conversation-store", daemon=True).start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _reader(self):
+        """Connection for reads on the calling thread"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+            db.row_factory = sqlite3.Row
+        return db
+
+    def save_conversation(self, conversation_id, personality, language, voice, tts_speed, summary, summarized_count):
+        """Queue an upsert of a conversation's settings and summary"""
+        now = time.time()
+        self._writes.put((
+            "INSERT INTO conversations (id, personality, language, voice, tts_speed, summary, summarized_count,"
+            " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET personality = excluded.personality, language = excluded.language,"
+            " voice = excluded.voice, tts_speed = excluded.tts_speed, summary = excluded.summary,"
+            " summarized_count = excluded.summarized_count, updated_at = excluded.updated_at",
+            (conversation_id, personality, language, voice, int(tts_speed), summary, summarized_count, now, now),
+        ))
+
+    def append_message(self, conversation_id, seq, message):
+        """Queue a message for writing at position seq of the conversation"""
+        self._writes.put((
+            "INSERT OR REPLACE INTO messages (conversation_id, seq, role, content, audio_key, tokens, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (conversation_id, seq, message["role"], message["content"], message.get("audio_key"),
+             estimate_tokens(message["content"]), time.time()),
+        ))
+
+    def delete_message(self, conversation_id, seq):
+        """Queue deletion of the message at position seq of a conversation"""
+        self._writes.put((
+            "DELETE FROM messages WHERE conversation_id = ? AND seq = ?", (conversation_id, seq)
+        ))
+
+    def clear_messages(self, conversation_id):
+        """Queue deletion of every message in a conversation"""
+        self._writes.put(("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)))
+
+    def flush(self):
+        """Block until every queued write is committed"""
+        done = threading.Event()
+        self._writes.put(done)
+        done.wait()
+
+    def load_conversation(self, conversation_id):
+        """Return a conversation's settings and message totals, or None if it doesn't exist"""
+        self.flush()
+        db = self._reader()
+        row = db.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        count, tokens, user_messages = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tokens), 0), COALESCE(SUM(role = 'user'), 0)"
+            " FROM messages WHERE conversation_id = ?",
+            (conversation_id,),
+        ).fetchone()
+        return {**dict(row), "message_count": count, "tokens": tokens, "user_messages": user_messages}
+
+    def list_conversations(self):
+        """Return the ids of every stored conversation, least recently updated first"""
+        self.flush()
+        return [row["id"] for row in self._reader().execute("SELECT id FROM conversations ORDER BY updated_at")]
+
+    def load_messages(self, conversation_id, start, end):
+        """Return messages start..end (exclusive) of a conversation, oldest first"""
+        self.flush()
+        rows = self._reader().execute(
+            "SELECT role, content, audio_key FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ?"
+            " ORDER BY seq",
+            (conversation_id, start, end),
+        ).fetchall()
+        messages = []
+        for row in rows:
+            message = {"role": row["role"], "content": row["content"]}
+            if row["audio_key"]:
+                message["audio_key"] = row["audio_key"]
+            messages.append(message)
+        return messages
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            batch = [self._writes.get()]
+            # Give other writes a moment to arrive so they share one transaction
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(self._writes.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            statements = [item for item in batch if not isinstance(item, threading.Event)]
+            if statements:
+                try:
+                    with db:
+                        for sql, params in statements:
+                            db.execute(sql, params)
+                    self.batches += 1
+                    self.writes += len(statements)
+                except sqlite3.Error:
+                    pass  # History is best effort; the conversation carries on in memory
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+
+class MessageHistory:
+    """Messages of one conversation, with older ones read back from the store on demand
+
+    Behaves like a list indexed over the whole conversation. Appends are
+    persisted in the background; the first `offset` messages are not held in
+    memory and are loaded a page at a time when they are accessed.
+    """
+
+    def __init__(self, conversation_id=None, store=None, offset=0, tokens=0):
+        self.conversation_id = conversation_id
+        self.store = store
+        self.offset = offset  # leading messages that are only in the store
+        self.resident = []  # messages held in memory, starting at index offset
+        self.tokens = tokens  # estimated tokens of the whole conversation
+
+    def __len__(self):
+        return self.offset + len(self.resident)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self)))
+            if indices:
+                self.load_from(min(indices[0], indices[-1]))
+            return [self.resident[i - self.offset] for i in indices]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        self.load_from(index)
+        return self.resident[index - self.offset]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def append(self, message):
+        self.resident.append(message)
+        self.tokens += estimate_tokens(message["content"])
+        if self.store is not None:
+            self.store.append_message(self.conversation_id, len(self) - 1, message)
+
+    def pop(self):
+        """Remove the last message, from memory and the store, and return it"""
+        message = self[-1]
+        self.resident.pop()
+        self.tokens -= estimate_tokens(message["content"])
+        if self.store is not None:
+            self.store.delete_message(self.conversation_id, len(self))
+        return message
+
+    def clear(self):
+        self.resident = []
+        self.offset = 0
+        self.tokens = 0
+        if self.store is not None:
+            self.store.clear_messages(self.conversation_id)
+
+    def head(self, count):
+        """The first count messages as a read-only history, without loading any from the store"""
+        view = MessageHistory(self.conversation_id, self.store, offset=min(self.offset, count))
+        view.resident = self.resident[:max(0, count - self.offset)]
+        return view
+
+    def load_from(self, index):
+        """Make sure messages from index onwards are in memory"""
+        if index >= self.offset:
+            return
+        start = min(index, max(0, self.offset - HISTORY_PAGE_SIZE))
+        self.resident[:0] = self.store.load_messages(self.conversation_id, start, self.offset)
+        self.offset = start
+
+    def unload(self, before):
+        """Drop messages before index `before` from memory; they stay in the store"""
+        if self.store is None:
+            return
+        before = min(before, len(self))
+        if before > self.offset:
+            del self.resident[:before - self.offset]
+            self.offset = before
+
+
+# Process-wide store, or None when persistence is disabled
+conversation_store = ConversationStore(CONVERSATION_DB) if CONVERSATION_DB else None
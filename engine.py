@@ -0,0 +1,523 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+import weakref
+
+# Cold start cost of the modules below is recorded as the engine_import metric
+_import_start = time.perf_counter()
+
+from blob_store import recording_store
+from commands import HELP_TEXT, parse_command
+from config import LANGUAGES, PERSONALITIES, VOICES
+from context_window import ContextWindow, estimate_tokens, messages_tokens
+from conversation_store import HISTORY_PAGE_SIZE, MessageHistory, conversation_store
+from gemini_chat import (
+    build_system_instruction, friendly_error, get_model, send_message, stream_chunks, summarize_conversation,
+)
+from metrics import metrics
+from response_cache import response_cache
+from stt import get_backend as get_stt_backend, transcribe_audio
+from tts import SentenceBuffer, SpeechPipeline
+from tts_backends import select_backend
+from tts_cache import audio_cache
+from tts_worker import tts_pool
+
+# Approximate bytes of conversation state a session may keep in memory
+SESSION_MEMORY_BUDGET = int(os.getenv("SESSION_MEMORY_BUDGET", str(2 * 1024 * 1024)))
+
+# Build Gemini clients, models and speech engines in the background at process start
+WARM_UP = os.getenv("WARM_UP", "false").lower() in ("1", "true", "yes")
+WARM_UP_CONNECT_TIMEOUT = float(os.getenv("WARM_UP_CONNECT_TIMEOUT", "10"))
+
+# Time taken to import the engine and the backends it loads eagerly, once per process
+metrics.record("engine_import", time.perf_counter() - _import_start)
+
+
+class Session:
+    """Conversation state for one user, independent of any front end"""
+
+    def __init__(self, personality="General Assistant", language="English", voice="Female",
+                 store=None, conversation_id=None):
+        self.id = conversation_id or uuid.uuid4().hex
+        self.personality = personality
+        self.language = language
+        self.voice = voice
+        self.tts_speed = False  # False = normal speed, True = slow speed
+        self.store = store  # ConversationStore the conversation is persisted to, if any
+        self.messages = MessageHistory(self.id, store)
+        self.chat = None  # Gemini ChatSession, kept across turns
+        self.chat_key = None  # (personality, language) the chat was built for
+        self.context = ContextWindow()  # Rolling summary of older turns
+        self.token_usage = None  # Prompt token counts for the last turn
+        self.turn = 0  # Number of user messages submitted, used to group metrics spans
+        self.last_recording = None  # Digest and size of the last transcribed recording (bytes stay on disk)
+        self.last_error = None  # Prompt and message of the last failed turn, until the next message is sent
+
+    @property
+    def language_config(self):
+        return LANGUAGES[self.language]
+
+    @property
+    def voice_config(self):
+        return VOICES[self.voice]
+
+    @property
+    def personality_config(self):
+        return PERSONALITIES[self.personality]
+
+    @property
+    def speech_settings(self):
+        """(language code, voice, slow, engine) that replies are synthesized with"""
+        backend, voice = select_backend(self.language_config, self.voice_config)
+        return self.language_config['tts_code'], voice, self.tts_speed, backend.name
+
+    @property
+    def pending_prompt(self):
+        """The user message still waiting for a reply, if any"""
+        if self.messages and self.messages[-1]["role"] == "user":
+            return self.messages[-1]["content"]
+        return None
+
+    def memory_usage(self):
+        """Approximate bytes of conversation state held in memory by this session"""
+        # Only messages in memory count; older ones are in the conversation store
+        message_bytes = [len(m["content"].encode()) for m in self.messages.resident]
+        usage = sum(message_bytes) + len((self.context.summary or "").encode())
+        if self.chat is not None:
+            # The Gemini chat keeps its own copy of the turns it was built from
+            usage += sum(message_bytes[max(0, self.context.summarized_count - self.messages.offset):])
+        return usage
+
+    def save(self):
+        """Queue a write of the settings and summary to the conversation store"""
+        if self.store is not None:
+            self.store.save_conversation(
+                self.id, self.personality, self.language, self.voice, self.tts_speed,
+                self.context.summary, self.context.summarized_count
+            )
+
+    def reset(self):
+        """Clear the chat history along with the Gemini chat and its summary"""
+        self.messages.clear()
+        self.chat = None
+        self.context = ContextWindow()
+        self.token_usage = None
+        self.last_error = None
+        self.save()
+
+    def set_personality(self, personality):
+        """Switch personality; this starts a new conversation"""
+        if personality != self.personality:
+            self.personality = personality
+            self.reset()
+
+    def set_language(self, language):
+        """Switch language; the chat is rebuilt with the new instruction on the next turn"""
+        self.language = language
+        self.save()
+
+    def set_voice(self, voice):
+        self.voice = voice
+        self.save()
+
+    def execute_command(self, command):
+        """Execute a parsed voice command and return the feedback message"""
+        if command == 'clear_chat':
+            self.reset()
+            return "✅ Chat history cleared!"
+
+        elif command == 'change_personality':
+            return "🔄 Please use the sidebar to select a different personality."
+
+        elif command == 'speak_faster':
+            self.tts_speed = False
+            self.save()
+            return "⚡ TTS speed set to normal (faster)."
+
+        elif command == 'speak_slower':
+            self.tts_speed = True
+            self.save()
+            return "🐢 TTS speed set to slow."
+
+        elif command == 'help':
+            return HELP_TEXT
+
+        return None
+
+
+class ConversationEngine:
+    """UI-independent voice assistant: transcribe, respond and synthesize for many sessions
+
+    All operations are coroutines meant to run on one event loop. Gemini calls
+    use the async client; speech recognition and synthesis run on worker
+    threads, so one slow session never blocks the others.
+    """
+
+    def __init__(self, store=None, response_cache=None):
+        # Sessions are owned by their front end and dropped from here when it lets go of them
+        self.sessions = weakref.WeakValueDictionary()
+        self.store = store  # ConversationStore for persistent conversations, or None
+        self.response_cache = response_cache  # ResponseCache for repeated prompts, or None
+
+    def create_session(self, **settings):
+        session = Session(store=self.store, **settings)
+        session.save()
+        self.sessions[session.id] = session
+        return session
+
+    def resume_session(self, conversation_id):
+        """Reopen a stored conversation, loading only its most recent messages
+
+        Returns None if there is no store or no such conversation.
+        """
+        record = self.store.load_conversation(conversation_id) if self.store is not None else None
+        if record is None:
+            return None
+        session = Session(
+            personality=record["personality"] if record["personality"] in PERSONALITIES else "General Assistant",
+            language=record["language"] if record["language"] in LANGUAGES else "English",
+            voice=record["voice"] if record["voice"] in VOICES else "Female",
+            store=self.store,
+            conversation_id=conversation_id,
+        )
+        session.tts_speed = bool(record["tts_speed"])
+        session.context.summary = record["summary"]
+        session.context.summarized_count = record["summarized_count"]
+        session.turn = record["user_messages"]
+        session.messages = MessageHistory(
+            conversation_id, self.store, offset=record["message_count"], tokens=record["tokens"]
+        )
+        # The unsummarized turns are needed for the next prompt, the last page for the transcript
+        session.messages.load_from(
+            min(record["summarized_count"], max(0, record["message_count"] - HISTORY_PAGE_SIZE))
+        )
+        self.sessions[session.id] = session
+        return session
+
+    def close_session(self, session):
+        self.sessions.pop(session.id, None)
+
+    async def transcribe(self, session, audio_bytes):
+        """Transcribe recorded audio in the session's language; returns (text, error)
+
+        The recording is kept in the shared recording store; the session only
+        remembers its digest and size.
+        """
+        lang = session.language_config
+        digest = recording_store.fingerprint(audio_bytes)
+        await asyncio.to_thread(recording_store.put, digest, audio_bytes)
+        session.last_recording = {"digest": digest, "size": len(audio_bytes)}
+        metrics.observe_size("recording", len(audio_bytes))
+        # Tagged with the engine that actually runs, which is Google if the configured one can't load
+        backend = await asyncio.to_thread(get_stt_backend, lang['stt_engine'])
+        # Recorded against the turn the transcript is about to start
+        with metrics.span("transcribe", session=session.id, turn=session.turn + 1, engine=backend.name):
+            return await asyncio.to_thread(transcribe_audio, audio_bytes, lang['speech_code'], lang['stt_engine'])
+
+    def submit_message(self, session, text):
+        """Run text as a command, or queue it as the next user message
+
+        Returns the command feedback, or None if the text is waiting for a reply.
+        """
+        command = parse_command(text, session.language)
+        if command:
+            return session.execute_command(command)
+        session.turn += 1
+        session.last_error = None
+        session.messages.append({"role": "user", "content": text})
+        metrics.observe_size("prompt", len(text.encode()))
+        return None
+
+    async def respond(self, session):
+        """Answer the pending user message and return the reply
+
+        If the turn fails, the prompt is taken back out of the history and the
+        error message is returned; both are kept in session.last_error.
+        """
+        if session.pending_prompt is None:
+            raise ValueError("No user message is waiting for a reply")
+        cache_key = self._response_cache_key(session)
+        cached = self.response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return self._finish_cached_turn(session, cached)
+        try:
+            chat = await self._prepare_chat(session)
+            with metrics.span("gemini_response", session=session.id, turn=session.turn):
+                session.chat, response = await send_message(chat, session.pending_prompt)
+                text = response.text
+            self._finish_turn(session, response, text)
+        except Exception as e:
+            return self._fail_turn(session, e)
+        if cache_key:
+            self.response_cache.put(cache_key, text)
+        return text
+
+    async def respond_stream(self, session, pipeline=None):
+        """Answer the pending user message, yielding text chunks as they arrive
+
+        If a SpeechPipeline is given, every completed sentence is handed to
+        it straight away so audio can start before the reply is finished.
+        A failed turn yields its error message, as respond() returns it.
+        """
+        if session.pending_prompt is None:
+            raise ValueError("No user message is waiting for a reply")
+        cache_key = self._response_cache_key(session)
+        cached = self.response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            if pipeline is not None:
+                # Usually served straight from the audio cache, as the reply was spoken before
+                await asyncio.to_thread(pipeline.submit, cached)
+            self._finish_cached_turn(session, cached)
+            yield cached
+            return
+
+        full_response = ""
+        try:
+            chat = await self._prepare_chat(session)
+            sentence_buffer = SentenceBuffer()
+            with metrics.span("gemini_response", session=session.id, turn=session.turn, stream=True):
+                start = time.perf_counter()
+                # The attempt's chat only replaces the session's once the reply is complete, so a
+                # stream abandoned part way never leaves a cut-off turn in the history
+                attempt_chat, response = await send_message(chat, session.pending_prompt, stream=True)
+                async for chunk in stream_chunks(response):
+                    if not full_response:
+                        metrics.record("gemini_first_chunk", time.perf_counter() - start,
+                                       session=session.id, turn=session.turn)
+                    full_response += chunk.text
+                    if pipeline is not None:
+                        for sentence in sentence_buffer.feed(chunk.text):
+                            await asyncio.to_thread(pipeline.submit, sentence)
+                    yield chunk.text
+            session.chat = attempt_chat
+
+            if pipeline is not None:
+                for sentence in sentence_buffer.flush():
+                    await asyncio.to_thread(pipeline.submit, sentence)
+            self._finish_turn(session, response, full_response)
+        except Exception as e:
+            yield self._fail_turn(session, e)
+            return
+        if cache_key:
+            self.response_cache.put(cache_key, full_response)
+
+    async def ask(self, session, text):
+        """Convenience for headless clients: submit text and return the command feedback or reply"""
+        feedback = self.submit_message(session, text)
+        if feedback is not None:
+            return feedback
+        return await self.respond(session)
+
+    def speech_pipeline(self, session):
+        """Create a sentence-level TTS pipeline with the session's voice settings"""
+        return SpeechPipeline(*session.speech_settings)
+
+    async def finish_speech(self, pipeline, text):
+        """Join a pipeline's audio and cache it under the full reply; returns None on failure"""
+        if not pipeline.futures:
+            return None  # Nothing was spoken, e.g. the reply was an error
+        try:
+            audio_bytes = await asyncio.to_thread(pipeline.join)
+        except Exception:
+            return None  # The reply is synthesized from scratch the next time it is played
+        await asyncio.to_thread(pipeline.store, text, audio_bytes)  # Also encodes it for delivery
+        return audio_bytes
+
+    def submit_synthesis(self, session, text, block=False):
+        """Queue synthesis on the shared TTS pool; returns a concurrent Future or None if the queue is full"""
+        return tts_pool.submit(text, *session.speech_settings, block=block)
+
+    def submit_encoding(self, session, text, audio_bytes, codec):
+        """Queue transcoding of text's audio to codec on the TTS pool; returns a Future of (key, audio_bytes) or None"""
+        return tts_pool.submit_encode(self.audio_key(session, text), audio_bytes, codec)
+
+    def audio_key(self, session, text):
+        """Audio cache key of text spoken with the session's voice settings"""
+        return audio_cache.make_key(text, *session.speech_settings)
+
+    async def synthesize(self, session, text):
+        """Synthesize text with the session's voice settings; returns (audio_bytes, feedback_msg)"""
+        # Submitting blocks while the TTS queue is full, so keep it off the event loop
+        future = await asyncio.to_thread(self.submit_synthesis, session, text, True)
+        return await asyncio.wrap_future(future)
+
+    async def _prepare_chat(self, session):
+        """Return the session's chat, compacting old turns and rebuilding it when needed"""
+        # Fold older turns into the summary once the recent ones exceed the token budget
+        previous_messages = session.messages.head(len(session.messages) - 1)  # Exclude the current prompt
+        if session.context.needs_compaction(previous_messages):
+            try:
+                with metrics.span("context_compaction", session=session.id, turn=session.turn):
+                    compacted = await asyncio.to_thread(
+                        session.context.compact, previous_messages, summarize_conversation
+                    )
+                if compacted:
+                    session.chat = None  # Rebuild with the new summary
+                    session.save()
+            except Exception:
+                pass  # Summarizing is best effort, keep sending the full recent history
+
+        # Reuse the chat; it is only rebuilt after a personality/language change or clear
+        chat_key = (session.personality, session.language)
+        if session.chat is None or session.chat_key != chat_key:
+            system_instruction = build_system_instruction(
+                session.personality_config['system_prompt'],
+                session.language_config['display_name']
+            )
+            # In a thread: the first call imports the Gemini SDK, and may wait on a warm-up building models
+            model = await asyncio.to_thread(get_model, session.personality, session.language, system_instruction)
+
+            # send_message adds the current prompt itself
+            session.chat = model.start_chat(history=session.context.history(previous_messages))
+            session.chat_key = chat_key
+        return session.chat
+
+    async def warm_up(self, connect=True):
+        """Pay the first turn's one-off costs ahead of time
+
+        Imports the Gemini SDK, builds the model for every personality and
+        language and loads the speech engines every language uses. With
+        connect, a token count opens the Gemini connection on the engine loop.
+        Best effort: failures leave the work to the first turn.
+        """
+        with metrics.span("warm_up") as span:
+            try:
+                model = await asyncio.to_thread(self._build_backends)
+                if connect:
+                    await asyncio.wait_for(model.count_tokens_async("warm up"), WARM_UP_CONNECT_TIMEOUT)
+                    span["connected"] = True
+            except Exception as e:
+                span["failure"] = str(e) or type(e).__name__
+
+    def _build_backends(self):
+        model = None
+        for language, language_config in LANGUAGES.items():
+            get_stt_backend(language_config['stt_engine'])
+            for voice_config in VOICES.values():
+                select_backend(language_config, voice_config)
+            for personality, personality_config in PERSONALITIES.items():
+                model = get_model(personality, language, build_system_instruction(
+                    personality_config['system_prompt'], language_config['display_name']
+                ))
+        return model
+
+    def memory_stats(self):
+        """Memory accounting across live sessions, for the metrics export"""
+        usage = [session.memory_usage() for session in list(self.sessions.values())]
+        return {
+            "sessions": len(usage),
+            "bytes": sum(usage),
+            "max_session_bytes": max(usage, default=0),
+            "over_budget": sum(1 for size in usage if size > SESSION_MEMORY_BUDGET),
+            "budget": SESSION_MEMORY_BUDGET,
+        }
+
+    def _enforce_budget(self, session):
+        """Shed what can be rebuilt when a session holds more than its memory budget"""
+        if session.memory_usage() <= SESSION_MEMORY_BUDGET:
+            return
+        # Rebuilt from the messages and summary on the next turn
+        session.chat = None
+        if session.memory_usage() > SESSION_MEMORY_BUDGET:
+            # Summarized messages are only needed again for the transcript, which reloads them on demand
+            session.messages.unload(session.context.summarized_count)
+
+    def _response_cache_key(self, session):
+        """Response cache key for the pending prompt, or None if the cache is disabled"""
+        if self.response_cache is None:
+            return None
+        end = len(session.messages) - 1  # The pending prompt itself
+        count = self.response_cache.context_messages
+        recent = session.messages[max(0, end - count):end] if count else []
+        return self.response_cache.make_key(
+            session.pending_prompt, session.personality, session.language, session.context.summary, recent
+        )
+
+    def _finish_cached_turn(self, session, reply):
+        # The Gemini chat never saw this exchange, so rebuild it from the messages next turn
+        session.chat = None
+        return self._finish_turn(session, None, reply)
+
+    def _finish_turn(self, session, response, text):
+        # Stored with the reply: the audio cache entry its speech is (or will be) synthesized into
+        session.messages.append({"role": "model", "content": text, "audio_key": self.audio_key(session, text)})
+        metrics.observe_size("reply", len(text.encode()))
+        sent_messages = session.messages.head(len(session.messages) - 1)
+        usage = getattr(response, "usage_metadata", None)
+        session.token_usage = {
+            "prompt_tokens": getattr(usage, "prompt_token_count", None),
+            "window_tokens": messages_tokens(sent_messages[session.context.summarized_count:]),
+            "full_history_tokens": session.messages.tokens - estimate_tokens(text),
+            "summarized_messages": session.context.summarized_count,
+        }
+        self._enforce_budget(session)
+        return text
+
+    def _fail_turn(self, session, error):
+        # The chat may hold a half-finished turn, rebuild it from the messages next time
+        session.chat = None
+        # The prompt is handed back rather than kept with an error as its reply, which
+        # would otherwise be sent to Gemini as context on every later turn
+        prompt = session.messages.pop()["content"]
+        session.last_error = {"prompt": prompt, "message": friendly_error(error)}
+        return session.last_error["message"]
+
+
+# One event loop in a background thread runs the engine for every session in
+# the process; synchronous front ends (like the Streamlit script) call into it
+_loop = None
+_loop_lock = threading.Lock()
+_engine = None
+_warm_up = None
+
+
+def get_loop():
+    """Return the shared engine event loop, starting its thread on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="engine-loop", daemon=True).start()
+        return _loop
+
+
+def get_engine():
+    """Return the process-wide ConversationEngine"""
+    global _engine
+    with _loop_lock:
+        if _engine is None:
+            _engine = ConversationEngine(store=conversation_store, response_cache=response_cache)
+        return _engine
+
+
+def start_warm_up():
+    """Warm the process-wide engine up on the engine loop, once per process; returns its Future"""
+    global _warm_up
+    engine, loop = get_engine(), get_loop()
+    with _loop_lock:
+        if _warm_up is None:
+            _warm_up = asyncio.run_coroutine_threadsafe(engine.warm_up(), loop)
+        return _warm_up
+
+
+def run_sync(coro, timeout=None):
+    """Run a coroutine on the engine loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def iterate_sync(async_iterator):
+    """Iterate an async iterator from synchronous code, one item at a time
+
+    If the caller stops early (e.g. a Streamlit run is interrupted), the
+    async iterator is closed too, which cancels whatever it was waiting on.
+    """
+    try:
+        while True:
+            try:
+                yield run_sync(async_iterator.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(async_iterator.aclose())
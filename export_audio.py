@@ -0,0 +1,189 @@
+"""Export conversations or text files as audio, synthesized across a pool of processes
+
+Usage:
+    python export_audio.py --all-conversations --output-dir audio/
+    python export_audio.py --conversation 3f2a... --roles assistant user
+    python export_audio.py lessons/*.txt --language Spanish --voice Male --slow --workers 8
+
+Each stored conversation or text file becomes one audio file. Text files are
+read paragraph by paragraph (paragraphs are separated by blank lines). Workers
+share one gTTS rate limit and the disk TTS cache, so anything the app has
+already spoken is not synthesized again.
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+
+from rate_limiter import TokenBucket
+
+# File extension for each format join_audio produces
+EXTENSIONS = {"audio/mpeg": ".mp3", "audio/wav": ".wav", "audio/ogg": ".ogg"}
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+# Stored message role for each --roles choice; the engine saves replies under Gemini's "model" role
+ROLES = {"assistant": "model", "user": "user"}
+
+
+class RateLimitManager(BaseManager):
+    """Serves one token bucket to every worker process, so the pool shares a single gTTS quota"""
+
+
+RateLimitManager.register("TokenBucket", TokenBucket)
+
+
+def _init_worker(bucket):
+    """Point a worker's gTTS calls at the shared bucket instead of its own"""
+    import tts
+
+    tts.tts_bucket = bucket
+
+
+def _synthesize(text, language_code, voice, slow, engine):
+    """Return (audio_bytes, feedback_msg, cached) for one message, run in a worker process"""
+    from tts import generate_tts_audio
+    from tts_cache import audio_cache
+
+    cached = audio_cache.make_key(text, language_code, voice, slow, engine) in audio_cache
+    audio_bytes, feedback_msg = generate_tts_audio(text, language_code, voice, slow, engine)
+    return audio_bytes, feedback_msg, cached
+
+
+def speech_settings(language, voice, slow):
+    """(language code, voice, slow, engine) for a language and voice name, as the app resolves them"""
+    from config import LANGUAGES, VOICES
+    from tts_backends import select_backend
+
+    language_config = LANGUAGES.get(language, LANGUAGES["English"])
+    backend, voice_id = select_backend(language_config, VOICES.get(voice, VOICES["Female"]))
+    return language_config["tts_code"], voice_id, slow, backend.name
+
+
+def read_text_file(path):
+    """Paragraphs of a text file, each with its line breaks folded into spaces"""
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    return [" ".join(paragraph.split()) for paragraph in PARAGRAPH_BREAK.split(content) if paragraph.strip()]
+
+
+def load_exports(args):
+    """Return (name, texts, speech settings) for everything to export"""
+    exports = []
+    conversation_ids = list(args.conversation or [])
+    if conversation_ids or args.all_conversations:
+        from conversation_store import conversation_store
+
+        if conversation_store is None:
+            sys.exit("CONVERSATION_DB is empty, there are no stored conversations to export")
+        if args.all_conversations:
+            conversation_ids += [cid for cid in conversation_store.list_conversations() if cid not in conversation_ids]
+        for conversation_id in conversation_ids:
+            record = conversation_store.load_conversation(conversation_id)
+            if record is None:
+                print(f"No conversation {conversation_id}, skipped", file=sys.stderr)
+                continue
+            messages = conversation_store.load_messages(conversation_id, 0, record["message_count"])
+            roles = {ROLES[role] for role in args.roles}
+            texts = [m["content"] for m in messages if m["role"] in roles and m["content"].strip()]
+            if messages and not texts:
+                print(f"{conversation_id}: {record['message_count']} messages but none from {' or '.join(args.roles)}",
+                      file=sys.stderr)
+            settings = speech_settings(record["language"], record["voice"], bool(record["tts_speed"]))
+            exports.append((conversation_id, texts, settings))
+
+    settings = speech_settings(args.language, args.voice, args.slow)
+    for path in args.files:
+        exports.append((os.path.splitext(os.path.basename(path))[0], read_text_file(path), settings))
+    return exports
+
+
+def export(exports, output_dir, workers):
+    """Synthesize every export on a process pool and write one audio file each
+
+    Returns the throughput report. Identical messages are synthesized once,
+    however many exports contain them.
+    """
+    from audio_encoding import audio_format
+    from tts import join_audio, tts_bucket
+    from tts_cache import audio_cache
+
+    os.makedirs(output_dir, exist_ok=True)
+    context = multiprocessing.get_context("spawn")  # Workers must not inherit the store's writer thread
+    report = {"files": 0, "failed": 0, "messages": 0, "characters": 0, "cached_characters": 0}
+
+    start = time.perf_counter()
+    with RateLimitManager(ctx=context) as manager:
+        bucket = manager.TokenBucket(tts_bucket.rate, tts_bucket.capacity)
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(bucket,)) as pool:
+            jobs = {}  # cache key -> (Future, characters)
+            for _, texts, settings in exports:
+                for text in texts:
+                    key = audio_cache.make_key(text, *settings)
+                    if key not in jobs:
+                        jobs[key] = pool.submit(_synthesize, text, *settings), len(text)
+
+            # Files are written in order as their messages finish; the pool keeps working meanwhile
+            for name, texts, settings in exports:
+                segments = []
+                error = "nothing to speak" if not texts else None
+                for text in texts:
+                    audio_bytes, feedback_msg, _ = jobs[audio_cache.make_key(text, *settings)][0].result()
+                    if audio_bytes is None:
+                        error = feedback_msg
+                        break
+                    segments.append(audio_bytes)
+                if error is not None:
+                    report["failed"] += 1
+                    print(f"{name}: {error}", file=sys.stderr)
+                    continue
+                audio_bytes = join_audio(segments)
+                path = os.path.join(output_dir, name + EXTENSIONS.get(audio_format(audio_bytes), ".mp3"))
+                with open(path, "wb") as f:
+                    f.write(audio_bytes)
+                report["files"] += 1
+                print(f"Wrote {path} ({len(texts)} messages, {sum(len(t) for t in texts)} characters)",
+                      file=sys.stderr)
+
+    for future, characters in jobs.values():
+        _, _, cached = future.result()
+        report["messages"] += 1
+        report["characters"] += characters
+        if cached:
+            report["cached_characters"] += characters
+    report["seconds"] = time.perf_counter() - start
+    report["chars_per_second"] = report["characters"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="text files to export")
+    parser.add_argument("--conversation", action="append", help="id of a stored conversation (repeatable)")
+    parser.add_argument("--all-conversations", action="store_true", help="export every stored conversation")
+    parser.add_argument("--roles", nargs="+", choices=sorted(ROLES), default=["assistant"],
+                        help="messages of stored conversations to speak")
+    parser.add_argument("--language", default="English", help="language of the text files")
+    parser.add_argument("--voice", default="Female", help="voice for the text files")
+    parser.add_argument("--slow", action="store_true", help="speak the text files slowly")
+    parser.add_argument("--output-dir", default="audio_export", help="directory to write audio files to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="synthesis processes")
+    args = parser.parse_args()
+    if not (args.files or args.conversation or args.all_conversations):
+        parser.error("give text files, --conversation or --all-conversations")
+
+    report = export(load_exports(args), args.output_dir, args.workers)
+    print(
+        f"{report['files']} files written, {report['failed']} failed; "
+        f"{report['characters']} characters in {report['messages']} messages "
+        f"({report['cached_characters']} from the cache) in {report['seconds']:.1f}s: "
+        f"{report['chars_per_second']:.0f} characters/second"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import re
+import threading
+
+from rate_limiter import CircuitBreaker, RetryPolicy
+
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Deadline in seconds for each Gemini request (for the first chunk, and between chunks, when streaming)
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+
+# Send a duplicate request when the first hasn't answered after this many seconds; 0 disables hedging
+GEMINI_HEDGE_AFTER = float(os.getenv("GEMINI_HEDGE_AFTER", "0"))
+
+# HTTP statuses worth retrying: timeouts, rate limits and server-side failures
+TRANSIENT_STATUS = re.compile(r"\b(408|429|500|502|503|504)\b")
+
+gemini_retry = RetryPolicy(
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "2")),
+    base_delay=float(os.getenv("GEMINI_BACKOFF_BASE", "0.5")),
+    max_delay=float(os.getenv("GEMINI_BACKOFF_MAX", "4.0")),
+)
+
+# Shared by every session: once Gemini keeps failing, turns fail fast instead of each waiting out its deadline
+gemini_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling Gemini while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Gemini is unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Given the current summary and new messages, return an updated summary that keeps every "
+    "fact, preference, decision and open question the assistant needs to continue the "
+    "conversation. Write it in the conversation's language and keep it under 300 words."
+)
+
+# Models are stateless apart from their system instruction, so one instance per
+# (personality, language) is shared by every session in the process
+_models = {}
+_models_lock = threading.Lock()
+_genai = None
+
+
+def get_genai():
+    """Return the configured google.generativeai module, importing it on first use
+
+    The SDK takes most of a second to import, so it is loaded when the first
+    model is built (or by the warm-up) rather than when the page first renders.
+    """
+    global _genai
+    with _models_lock:
+        if _genai is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+            _genai = genai
+        return _genai
+
+
+def build_system_instruction(personality_prompt, language_display_name):
+    """Combine the personality prompt with the response language instruction"""
+    return personality_prompt + f"\n\nIMPORTANT: Please respond in {language_display_name}."
+
+
+def get_model(personality, language, system_instruction):
+    """Return the cached GenerativeModel for a personality and language"""
+    key = (personality, language)
+    genai = get_genai()
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(MODEL_NAME, system_instruction=system_instruction)
+            _models[key] = model
+        return model
+
+
+def summarize_conversation(previous_summary, messages):
+    """Fold messages into an updated summary of the conversation so far"""
+    genai = get_genai()
+    with _models_lock:
+        model = _models.get("summarizer")
+        if model is None:
+            model = genai.GenerativeModel(MODEL_NAME, system_instruction=SUMMARY_INSTRUCTION)
+            _models["summarizer"] = model
+
+    transcript = "\n".join(
+        f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in messages
+    )
+    prompt = f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+    # Summaries are best effort, so they get the deadline but no retries
+    return model.generate_content(prompt, request_options={"timeout": GEMINI_TIMEOUT}).text.strip()
+
+
+def is_transient_error(error):
+    """Return True if a Gemini error is a timeout, rate limit or server-side failure"""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and TRANSIENT_STATUS.fullmatch(str(int(code))):
+        return True
+    return bool(TRANSIENT_STATUS.search(str(error)))
+
+
+async def send_message(chat, prompt, stream=False):
+    """Send prompt with deadlines, jittered retries, optional hedging and the circuit breaker
+
+    Every attempt runs on its own copy of chat, so failed, timed out or
+    losing hedged attempts never leave a half-finished turn in its history.
+    Returns (chat, response) where chat is the copy holding the new turn.
+    """
+    if not gemini_breaker.allow():
+        raise UpstreamUnavailable(gemini_breaker.retry_after())
+
+    async def attempt():
+        attempt_chat = chat.model.start_chat(history=chat.history)
+        response = await asyncio.wait_for(attempt_chat.send_message_async(prompt, stream=stream), GEMINI_TIMEOUT)
+        return attempt_chat, response
+
+    try:
+        result = await gemini_retry.call_async(lambda: _hedged(attempt), is_transient_error)
+    except Exception as e:
+        _record_outcome(e)
+        raise
+    except BaseException:
+        # Cancelled, e.g. the client went away: a probe must not leave the breaker half open for good
+        gemini_breaker.release()
+        raise
+    gemini_breaker.record_success()
+    return result
+
+
+async def stream_chunks(response):
+    """Iterate a streamed response, failing if the next chunk takes longer than the deadline"""
+    iterator = response.__aiter__()
+    while True:
+        try:
+            chunk = await asyncio.wait_for(iterator.__anext__(), GEMINI_TIMEOUT)
+        except StopAsyncIteration:
+            return
+        except Exception as e:
+            _record_outcome(e)
+            raise
+        yield chunk
+
+
+def _record_outcome(error):
+    # Any answer from Gemini, even a refusal of this particular request, shows it is up
+    if is_transient_error(error):
+        gemini_breaker.record_failure()
+    else:
+        gemini_breaker.record_success()
+
+
+hedge_stats = {"hedged": 0, "hedge_wins": 0}
+_hedge_lock = threading.Lock()
+
+
+async def _hedged(make_attempt):
+    """Run make_attempt, starting a duplicate if it is slower than GEMINI_HEDGE_AFTER; first success wins"""
+    first = asyncio.ensure_future(make_attempt())
+    if GEMINI_HEDGE_AFTER <= 0:
+        return await first
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=GEMINI_HEDGE_AFTER)
+        if done:
+            return first.result()
+
+        second = asyncio.ensure_future(make_attempt())
+        pending.add(second)
+        with _hedge_lock:
+            hedge_stats["hedged"] += 1
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        with _hedge_lock:
+                            hedge_stats["hedge_wins"] += 1
+                    return task.result()
+            if not pending:
+                raise task.exception()
+    finally:
+        # The losing (or abandoned) attempt's turn is discarded along with its chat copy
+        for task in pending:
+            task.cancel()
+
+
+def resilience_stats():
+    """Return retry, hedging and circuit breaker counters for display and monitoring"""
+    with _hedge_lock:
+        hedges = dict(hedge_stats)
+    return {
+        "retried": gemini_retry.retried,
+        "exhausted": gemini_retry.exhausted,
+        **hedges,
+        "breaker_state": gemini_breaker.state,
+        "breaker_opened": gemini_breaker.opened,
+        "breaker_rejected": gemini_breaker.rejected,
+    }
+
+
+def friendly_error(error):
+    """Message shown to the user for a failed turn"""
+    if isinstance(error, UpstreamUnavailable):
+        seconds = max(1, round(error.retry_after))
+        return (f"⚠️ The assistant is temporarily unavailable. "
+                f"Please try again in {seconds} second{'s' if seconds > 1 else ''}.")
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "⚠️ The assistant took too long to answer. Please try again."
+    if is_transient_error(error):
+        return "⚠️ The assistant is busy right now. Please try again in a moment."
+    return f"❌ Error: {str(error)}"
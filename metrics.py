@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency histogram bucket bounds in seconds (Prometheus style, +Inf is implicit)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Append every span as one JSON line to this file when set
+METRICS_LOG_FILE = os.getenv("METRICS_LOG_FILE")
+
+# Serve Prometheus text on http://0.0.0.0:<METRICS_PORT>/metrics when set
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+
+class StageStats:
+    """Latency histogram plus a window of recent samples for percentiles"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.recent = deque(maxlen=500)
+
+    def observe(self, seconds, error=False):
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Metrics:
+    """Process-wide registry of stage latencies, payload sizes and recent spans"""
+
+    def __init__(self, log_file=None):
+        self.stages = {}  # stage name -> StageStats
+        self.payload_bytes = {}  # payload name -> [count, total bytes]
+        self.spans = deque(maxlen=1000)  # most recent spans, for per-turn traces
+        self.log_file = log_file
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, error=False, **attributes):
+        """Record one finished span"""
+        span = {"stage": stage, "ms": round(seconds * 1000, 3), "ts": time.time(), "error": error, **attributes}
+        with self._lock:
+            self.stages.setdefault(stage, StageStats()).observe(seconds, error)
+            self.spans.append(span)
+            if self.log_file:
+                with open(self.log_file, "a") as f:
+                    f.write(json.dumps(span, default=str) + "\n")
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        """Time a block as one span of stage; attributes are kept with the span (session, turn, ...)"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield attributes  # the block may add attributes, e.g. payload sizes
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, error, **attributes)
+
+    def observe_size(self, name, size):
+        """Count a payload and its size in bytes"""
+        with self._lock:
+            entry = self.payload_bytes.setdefault(name, [0, 0])
+            entry[0] += 1
+            entry[1] += size
+
+    def stage_summary(self):
+        """Per-stage count, mean and percentiles in milliseconds"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "mean_ms": stats.total / stats.count * 1000 if stats.count else None,
+                    "p50_ms": (stats.percentile(0.5) or 0) * 1000,
+                    "p95_ms": (stats.percentile(0.95) or 0) * 1000,
+                }
+                for stage, stats in sorted(self.stages.items())
+            }
+
+    def payload_summary(self):
+        with self._lock:
+            return {
+                name: {"count": count, "bytes": total, "mean_bytes": total / count if count else 0}
+                for name, (count, total) in sorted(self.payload_bytes.items())
+            }
+
+    def turn_spans(self, session_id, turn):
+        """Spans recorded for one turn of one session"""
+        with self._lock:
+            return [s for s in self.spans if s.get("session") == session_id and s.get("turn") == turn]
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        # Imported here so exporting never slows down importing this module
+        from audio_encoding import audio_encoder
+        from blob_store import recording_store
+        from engine import get_engine
+        from gemini_chat import resilience_stats
+        from response_cache import response_cache
+        from stt import unavailable_engines as unavailable_stt_engines
+        from tts import rate_limit_stats
+        from tts_backends import unavailable_engines as unavailable_tts_engines
+        from tts_cache import audio_cache
+        from tts_worker import tts_pool
+
+        lines = [
+            "# HELP voice_stage_seconds Latency of each voice turn pipeline stage",
+            "# TYPE voice_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, stats in sorted(self.stages.items()):
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    lines.append(f'voice_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'voice_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats.count}')
+                lines.append(f'voice_stage_seconds_sum{{stage="{stage}"}} {stats.total}')
+                lines.append(f'voice_stage_seconds_count{{stage="{stage}"}} {stats.count}')
+            lines.append("# HELP voice_stage_errors_total Spans that ended in an exception")
+            lines.append("# TYPE voice_stage_errors_total counter")
+            for stage, stats in sorted(self.stages.items()):
+                lines.append(f'voice_stage_errors_total{{stage="{stage}"}} {stats.errors}')
+            lines.append("# HELP voice_payload_bytes_total Bytes of payload handled, by kind")
+            lines.append("# TYPE voice_payload_bytes_total counter")
+            for name, (_, total) in sorted(self.payload_bytes.items()):
+                lines.append(f'voice_payload_bytes_total{{payload="{name}"}} {total}')
+            lines.append("# HELP voice_payload_count_total Payloads handled, by kind")
+            lines.append("# TYPE voice_payload_count_total counter")
+            for name, (count, _) in sorted(self.payload_bytes.items()):
+                lines.append(f'voice_payload_count_total{{payload="{name}"}} {count}')
+
+        cache = audio_cache.stats()
+        recordings = recording_store.stats()
+        limiter = rate_limit_stats()
+        memory = get_engine().memory_stats()
+        encoding = audio_encoder.stats()
+        gemini = resilience_stats()
+        lines += [
+            "# TYPE tts_cache_hits_total counter",
+            f"tts_cache_hits_total {cache['hits']}",
+            "# TYPE tts_cache_misses_total counter",
+            f"tts_cache_misses_total {cache['misses']}",
+            "# TYPE tts_cache_evictions_total counter",
+            f"tts_cache_evictions_total {cache['evictions']}",
+            "# TYPE tts_cache_bytes gauge",
+            f"tts_cache_bytes {cache['bytes']}",
+            "# TYPE tts_requests_total counter",
+            f"tts_requests_total {limiter['requests']}",
+            "# TYPE tts_requests_throttled_total counter",
+            f"tts_requests_throttled_total {limiter['throttled']}",
+            "# TYPE tts_requests_retried_total counter",
+            f"tts_requests_retried_total {limiter['retried']}",
+            "# TYPE tts_rate_limit_wait_seconds_total counter",
+            f"tts_rate_limit_wait_seconds_total {limiter['wait_seconds']}",
+            "# TYPE tts_requests_queued gauge",
+            f"tts_requests_queued {limiter['queued']}",
+            "# TYPE tts_jobs_pending gauge",
+            f"tts_jobs_pending {tts_pool.pending()}",
+            "# HELP tts_encoded_total Replies transcoded for delivery",
+            "# TYPE tts_encoded_total counter",
+            f"tts_encoded_total {encoding['encoded']}",
+            "# TYPE tts_encode_source_bytes_total counter",
+            f"tts_encode_source_bytes_total {encoding['source_bytes']}",
+            "# TYPE tts_encode_output_bytes_total counter",
+            f"tts_encode_output_bytes_total {encoding['encoded_bytes']}",
+            "# TYPE tts_encode_failures_total counter",
+            f"tts_encode_failures_total {encoding['failed']}",
+            "# TYPE tts_encode_available gauge",
+            f"tts_encode_available {0 if encoding['error'] else 1}",
+            "# TYPE gemini_retries_total counter",
+            f"gemini_retries_total {gemini['retried']}",
+            "# TYPE gemini_retries_exhausted_total counter",
+            f"gemini_retries_exhausted_total {gemini['exhausted']}",
+            "# HELP gemini_hedged_requests_total Duplicate requests sent because the first was slow",
+            "# TYPE gemini_hedged_requests_total counter",
+            f"gemini_hedged_requests_total {gemini['hedged']}",
+            "# TYPE gemini_hedge_wins_total counter",
+            f"gemini_hedge_wins_total {gemini['hedge_wins']}",
+            "# HELP gemini_breaker_open 1 while the circuit breaker refuses Gemini calls",
+            "# TYPE gemini_breaker_open gauge",
+            f"gemini_breaker_open {0 if gemini['breaker_state'] == 'closed' else 1}",
+            "# TYPE gemini_breaker_opened_total counter",
+            f"gemini_breaker_opened_total {gemini['breaker_opened']}",
+            "# TYPE gemini_breaker_rejected_total counter",
+            f"gemini_breaker_rejected_total {gemini['breaker_rejected']}",
+            "# TYPE recording_store_bytes gauge",
+            f"recording_store_bytes {recordings['bytes']}",
+            "# TYPE recording_store_entries gauge",
+            f"recording_store_entries {recordings['entries']}",
+            "# HELP voice_sessions Live conversation sessions",
+            "# TYPE voice_sessions gauge",
+            f"voice_sessions {memory['sessions']}",
+            "# HELP voice_session_memory_bytes Approximate conversation state held in memory",
+            "# TYPE voice_session_memory_bytes gauge",
+            f"voice_session_memory_bytes {memory['bytes']}",
+            "# TYPE voice_session_memory_max_bytes gauge",
+            f"voice_session_memory_max_bytes {memory['max_session_bytes']}",
+            "# TYPE voice_session_memory_budget_bytes gauge",
+            f"voice_session_memory_budget_bytes {memory['budget']}",
+            "# TYPE voice_sessions_over_budget gauge",
+            f"voice_sessions_over_budget {memory['over_budget']}",
+        ]
+        if response_cache is not None:
+            responses = response_cache.stats()
+            lines += [
+                "# TYPE response_cache_hits_total counter",
+                f"response_cache_hits_total {responses['hits']}",
+                "# TYPE response_cache_misses_total counter",
+                f"response_cache_misses_total {responses['misses']}",
+                "# TYPE response_cache_evictions_total counter",
+                f"response_cache_evictions_total {responses['evictions']}",
+                "# TYPE response_cache_entries gauge",
+                f"response_cache_entries {responses['entries']}",
+            ]
+        lines.append("# HELP stt_engine_unavailable Speech recognition engines that failed to load (Google is used)")
+        lines.append("# TYPE stt_engine_unavailable gauge")
+        for name in sorted(unavailable_stt_engines()):
+            lines.append(f'stt_engine_unavailable{{engine="{name}"}} 1')
+        lines.append("# HELP tts_engine_unavailable Text-to-speech engines that failed to load (gTTS is used)")
+        lines.append("# TYPE tts_engine_unavailable gauge")
+        for name in sorted(unavailable_tts_engines()):
+            lines.append(f'tts_engine_unavailable{{engine="{name}"}} 1')
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would otherwise flood the console
+
+
+_server = None
+_server_error = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port):
+    """Serve /metrics on port from a background thread (once per process)
+
+    Returns the server, or None if the port could not be bound; the failure
+    is remembered so reruns don't keep retrying it.
+    """
+    global _server, _server_error
+    with _server_lock:
+        if _server is None and _server_error is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError as e:
+                _server_error = e
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
+
+
+def metrics_server_error():
+    """The error that stopped the metrics endpoint from starting, if any"""
+    return _server_error
+
+
+# Process-wide registry
+metrics = Metrics(log_file=METRICS_LOG_FILE)
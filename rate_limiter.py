@@ -0,0 +1,164 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every caller in the process
+
+    Requests pass straight through while tokens are available, so there is no
+    added latency when we are under quota; once the bucket is empty callers
+    wait just long enough for the next token.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.queued = 0  # callers currently waiting for a token
+        self.throttled = 0  # acquisitions that had to wait
+        self.acquired = 0
+        self.wait_seconds = 0.0  # total time callers spent waiting for tokens
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        waited = False
+        with self._lock:
+            self.queued += 1
+        try:
+            while True:
+                with self._lock:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.acquired += 1
+                        if waited:
+                            self.throttled += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                waited = True
+                time.sleep(wait)
+                with self._lock:
+                    self.wait_seconds += wait
+        finally:
+            with self._lock:
+                self.queued -= 1
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for calls that can be rate limited upstream"""
+
+    def __init__(self, max_retries, base_delay, max_delay):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retried = 0  # individual retry attempts
+        self.exhausted = 0  # calls that still failed after the last retry
+        self._lock = threading.Lock()
+
+    def delay(self, attempt):
+        """Return the sleep before retry number attempt (0-based), with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, is_retryable, bucket=None):
+        """Call func, retrying with backoff while is_retryable(exception) is true"""
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                return func()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt >= self.max_retries:
+                    with self._lock:
+                        self.exhausted += 1
+                    raise
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self.delay(attempt))
+                attempt += 1
+
+    async def call_async(self, func, is_retryable):
+        """Await func(), retrying with backoff while is_retryable(exception) is true"""
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt >= self.max_retries:
+                    with self._lock:
+                        self.exhausted += 1
+                    raise
+                with self._lock:
+                    self.retried += 1
+                await asyncio.sleep(self.delay(attempt))
+                attempt += 1
+
+
+class CircuitBreaker:
+    """Fails calls fast while an upstream keeps failing, then probes it again
+
+    After failure_threshold consecutive failures the breaker opens and calls
+    are refused for reset_timeout seconds. The first call after that is let
+    through as a probe: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"  # closed, open or half_open (a probe is in flight)
+        self.failures = 0  # consecutive failures
+        self.opened = 0  # times the breaker has opened
+        self.rejected = 0  # calls refused while open
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go ahead"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self):
+        """Seconds until the breaker lets a probe through"""
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened += 1
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Call ended with neither outcome (e.g. cancelled): an unfinished probe waits out another timeout"""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic()
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import threading
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Opt-in: replies to repeated prompts are served from memory instead of calling Gemini
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Messages before the prompt that must also match for a cached reply to be reused
+RESPONSE_CACHE_CONTEXT_MESSAGES = int(os.getenv("RESPONSE_CACHE_CONTEXT_MESSAGES", "2"))
+
+WHITESPACE = re.compile(r"\s+")
+TRAILING_PUNCTUATION = re.compile(r"[\s.!?。！？]+$")
+
+
+def normalize_prompt(prompt):
+    """Form of a prompt that cache keys are built from
+
+    Only case, width, spacing and the closing punctuation are ignored; symbols
+    and accents change the meaning ("2+2" vs "2-2", "año" vs "ano") and are kept.
+    """
+    text = WHITESPACE.sub(" ", unicodedata.normalize("NFKC", prompt).casefold()).strip()
+    return TRAILING_PUNCTUATION.sub("", text)
+
+
+class ResponseCache:
+    """In-memory LRU cache of Gemini replies with a time-to-live
+
+    Keyed by the normalized prompt, personality, language and a hash of the
+    recent context, so a reply is only reused where it would make sense.
+    """
+
+    def __init__(self, ttl, max_entries, context_messages=RESPONSE_CACHE_CONTEXT_MESSAGES):
+        self.ttl = ttl  # seconds a reply stays valid
+        self.max_entries = max_entries
+        self.context_messages = context_messages
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (reply, expires at), least recently used first
+        self._lock = threading.Lock()
+
+    def make_key(self, prompt, personality, language, summary, recent_messages):
+        """Hash everything that shapes the reply into a cache key
+
+        recent_messages are the last context_messages messages before the prompt.
+        """
+        context = hashlib.sha256()
+        context.update(summary.encode("utf-8"))
+        for message in recent_messages:
+            context.update(b"\x00" + message["role"].encode() + b"\x00" + message["content"].encode("utf-8"))
+        payload = "\x00".join([normalize_prompt(prompt), personality, language, context.hexdigest()])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached reply for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, reply):
+        """Cache a successful reply; error replies are never stored"""
+        if not reply or reply.startswith("❌"):
+            return
+        with self._lock:
+            self._entries[key] = (reply, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Return counters for display and monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+# Process-wide cache shared by all sessions, or None when disabled
+response_cache = ResponseCache(
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+) if RESPONSE_CACHE_ENABLED else None
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import speech_recognition as sr
+
+from audio_processing import EndpointDetector, prepare_for_recognition, to_pcm16
+
+# Engine used for every language, overriding the LANGUAGES table (e.g. "stub" in tests)
+STT_ENGINE_OVERRIDE = os.getenv("STT_ENGINE")
+
+# Vosk models are looked up as <VOSK_MODEL_DIR>/<speech_code>, e.g. models/vosk/en-US
+VOSK_MODEL_DIR = os.getenv("VOSK_MODEL_DIR", os.path.join("models", "vosk"))
+
+
+class STTBackend:
+    """Speech-to-text engine interface
+
+    transcribe() takes a speech_recognition.AudioData and a speech code such
+    as "en-US", and raises sr.UnknownValueError / sr.RequestError on failure
+    just like the SpeechRecognition recognizers do.
+    """
+
+    name = "base"
+    local = False
+    sample_rate = 16000  # preferred input rate, audio is resampled to it before recognition
+
+    def transcribe(self, audio_data, language_code):
+        raise NotImplementedError
+
+    def open_stream(self, language_code):
+        """Return a native streaming recognizer, or None if the engine only handles whole clips"""
+        return None
+
+
+class GoogleBackend(STTBackend):
+    """Google Web Speech API (network round-trip per utterance)"""
+
+    name = "google"
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio_data, language_code):
+        return self.recognizer.recognize_google(audio_data, language=language_code)
+
+
+class VoskBackend(STTBackend):
+    """Offline recognition with Vosk; one model per language, loaded on first use"""
+
+    name = "vosk"
+    local = True
+
+    def __init__(self, model_dir=VOSK_MODEL_DIR):
+        import vosk  # Optional dependency: pip install vosk
+
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model_dir = model_dir
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, language_code):
+        with self._lock:
+            model = self._models.get(language_code)
+            if model is None:
+                path = os.path.join(self.model_dir, language_code)
+                if not os.path.isdir(path):
+                    raise sr.RequestError(f"No Vosk model for {language_code} in {path}")
+                model = self.vosk.Model(path)
+                self._models[language_code] = model
+            return model
+
+    def transcribe(self, audio_data, language_code):
+        # Models are shared, recognizers are cheap and hold per-utterance state
+        recognizer = self.vosk.KaldiRecognizer(self._model(language_code), self.sample_rate)
+        recognizer.AcceptWaveform(audio_data.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def open_stream(self, language_code):
+        return _VoskStream(self.vosk.KaldiRecognizer(self._model(language_code), self.sample_rate))
+
+
+class _VoskStream:
+    """Feeds PCM to a Kaldi recognizer as it arrives and reports its partial result"""
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.finished = []  # text of utterances Vosk has already finalized
+
+    def accept(self, pcm):
+        if self.recognizer.AcceptWaveform(pcm):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            if text:
+                self.finished.append(text)
+            partial = ""
+        else:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        return " ".join(self.finished + ([partial] if partial else []))
+
+    def finish(self):
+        text = json.loads(self.recognizer.FinalResult()).get("text", "")
+        return " ".join(self.finished + ([text] if text else []))
+
+
+class SphinxBackend(STTBackend):
+    """Offline recognition with CMU PocketSphinx, using SpeechRecognition's model layout
+
+    SpeechRecognition ships the en-US model in its pocketsphinx-data
+    directory; other languages are used once their model is installed there.
+    """
+
+    name = "sphinx"
+    local = True
+
+    def __init__(self):
+        import pocketsphinx  # Optional dependency: pip install pocketsphinx
+
+        self.pocketsphinx = pocketsphinx
+        self.data_dir = os.path.join(os.path.dirname(sr.__file__), "pocketsphinx-data")
+        self._decoders = {}
+        self._lock = threading.Lock()
+
+    def _decoder(self, language_code):
+        decoder = self._decoders.get(language_code)
+        if decoder is None:
+            path = os.path.join(self.data_dir, language_code)
+            if not os.path.isdir(path):
+                raise sr.RequestError(f"No PocketSphinx model for {language_code} in {path}")
+            decoder = self.pocketsphinx.Decoder(
+                hmm=os.path.join(path, "acoustic-model"),
+                lm=os.path.join(path, "language-model.lm.bin"),
+                dict=os.path.join(path, "pronounciation-dictionary.dict"),
+                logfn=os.devnull,
+            )
+            self._decoders[language_code] = decoder
+        return decoder
+
+    def transcribe(self, audio_data, language_code):
+        raw = audio_data.get_raw_data(convert_rate=self.sample_rate, convert_width=2)
+        # A decoder holds one utterance at a time, so calls are serialized
+        with self._lock:
+            decoder = self._decoder(language_code)
+            decoder.start_utt()
+            decoder.process_raw(raw, full_utt=True)
+            decoder.end_utt()
+            hypothesis = decoder.hyp()
+        if hypothesis is None or not hypothesis.hypstr:
+            raise sr.UnknownValueError()
+        return hypothesis.hypstr
+
+
+class StubBackend(STTBackend):
+    """Deterministic backend for tests: returns a canned transcript per audio clip"""
+
+    name = "stub"
+    local = True
+
+    def __init__(self, responses=None, default=None):
+        self.responses = responses or {}  # sha256 of raw audio -> transcript
+        self.default = default if default is not None else os.getenv("STT_STUB_TEXT", "hello")
+
+    @staticmethod
+    def fingerprint(raw_audio):
+        return hashlib.sha256(raw_audio).hexdigest()
+
+    def transcribe(self, audio_data, language_code):
+        text = self.responses.get(self.fingerprint(audio_data.get_raw_data()), self.default)
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+BACKENDS = {
+    "google": GoogleBackend,
+    "vosk": VoskBackend,
+    "sphinx": SphinxBackend,
+    "stub": StubBackend,
+}
+
+# One instance per engine for the whole process, so local models are loaded once
+_backends = {}
+_unavailable = {}  # engine name -> reason it could not be initialized
+_backends_lock = threading.RLock()
+
+
+def get_backend(name):
+    """Return the shared backend for an engine name, falling back to Google if it can't load"""
+    return _load_backend(STT_ENGINE_OVERRIDE or name)
+
+
+def _load_backend(name):
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is not None:
+            return backend
+        try:
+            backend = BACKENDS[name]()
+        except Exception as e:
+            if name == "google":
+                raise
+            _unavailable[name] = str(e) or type(e).__name__
+            backend = _load_backend("google")
+        _backends[name] = backend
+        return backend
+
+
+def transcribe_audio(audio_bytes, language_code="en-US", engine="google"):
+    """Convert recorded audio bytes to text; returns (text, error_message)"""
+    try:
+        # Shared per-process backend (local models are loaded once, not per call)
+        backend = get_backend(engine)
+
+        # Decode the recorder's WAV, down-mix, resample and trim silence
+        pcm = prepare_for_recognition(audio_bytes, backend.sample_rate)
+        if not pcm:
+            return None, "No speech detected. Please try again."
+
+        # Convert PCM to audio data
+        audio_data = sr.AudioData(pcm, sample_rate=backend.sample_rate, sample_width=2)
+
+        # Perform recognition with specified language
+        text = backend.transcribe(audio_data, language_code)
+        return text, None
+    except sr.UnknownValueError:
+        return None, "Could not understand audio. Please try again."
+    except sr.RequestError as e:
+        return None, f"Could not request results from speech recognition service: {e}"
+    except Exception as e:
+        return None, f"Error during transcription: {str(e)}"
+
+
+# Segments of a live recording are transcribed while the user keeps talking
+_segment_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stt-segment")
+
+
+class StreamingTranscriber:
+    """Transcribes audio while it is being recorded
+
+    Engines with native streaming (Vosk) get every chunk and report their
+    partial hypothesis. Other engines get each stretch of speech as soon as
+    the speaker pauses, so by the time speech ends only the last few words
+    are still being recognized.
+    """
+
+    def __init__(self, backend, language_code):
+        self.backend = backend
+        self.language_code = language_code
+        self.endpoint = EndpointDetector(backend.sample_rate)
+        self.ended = False
+        self.partial = ""
+        self._stream = backend.open_stream(language_code)
+        self._segment = []  # chunks of speech since the last pause
+        self._futures = []  # transcription of each finished segment, in order
+
+    def accept(self, samples):
+        """Feed mono float samples at the backend's sample rate; returns the partial transcript"""
+        event = self.endpoint.update(samples)
+        if self._stream is not None:
+            self.partial = self._stream.accept(to_pcm16(samples))
+        else:
+            if self.endpoint.in_speech:
+                self._segment.append(samples)
+            if event is not None:
+                self._submit_segment()
+            self.partial = " ".join(self._finished_texts())
+        if event == "end":
+            self.ended = True
+        return self.partial
+
+    def finish(self):
+        """Return the final transcript once all audio has been fed"""
+        if self._stream is not None:
+            return self._stream.finish()
+        self._submit_segment()
+        return " ".join(text for text in (future.result() for future in self._futures) if text)
+
+    def _finished_texts(self):
+        texts = []
+        for future in self._futures:
+            if not future.done():
+                break
+            if future.exception() is None and future.result():
+                texts.append(future.result())
+        return texts
+
+    def _submit_segment(self):
+        if not self._segment:
+            return
+        pcm = to_pcm16(np.concatenate(self._segment))
+        self._segment = []
+        self._futures.append(_segment_executor.submit(self._transcribe_segment, pcm))
+
+    def _transcribe_segment(self, pcm):
+        audio_data = sr.AudioData(pcm, sample_rate=self.backend.sample_rate, sample_width=2)
+        try:
+            return self.backend.transcribe(audio_data, self.language_code)
+        except sr.UnknownValueError:
+            return ""
+
+
+def unavailable_engines():
+    """Return the engines that failed to initialize and why"""
+    with _backends_lock:
+        return dict(_unavailable)
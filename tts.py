@@ -0,0 +1,286 @@
+import os
+import re
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from audio_encoding import audio_encoder, audio_format
+from metrics import metrics
+from rate_limiter import RetryPolicy, TokenBucket
+from tts_backends import get_backend
+from tts_cache import audio_cache
+
+# Sentence boundaries: Western punctuation followed by whitespace, or CJK
+# full-width punctuation (which is not followed by a space)
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|(?<=[。！？])')
+
+# Clause boundaries, used to break up sentences that are too long for one segment
+CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:，；：、])\s*')
+
+# Longest piece of text synthesized in a single segment
+MAX_SEGMENT_CHARS = int(os.getenv("TTS_SEGMENT_CHARS", "500"))
+
+# Segments of one long reply are synthesized in parallel on their own pool, so
+# jobs running on the TTS worker pool never wait on that same pool
+_segment_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TTS_SEGMENT_WORKERS", "4")),
+    thread_name_prefix="tts-segment",
+)
+
+# Shared gTTS quota for every session in the process
+tts_bucket = TokenBucket(
+    rate=float(os.getenv("TTS_RATE_PER_SEC", "2")),
+    capacity=float(os.getenv("TTS_BURST", "5")),
+)
+tts_retry = RetryPolicy(
+    max_retries=int(os.getenv("TTS_MAX_RETRIES", "4")),
+    base_delay=float(os.getenv("TTS_BACKOFF_BASE", "1.0")),
+    max_delay=float(os.getenv("TTS_BACKOFF_MAX", "30.0")),
+)
+
+
+def synthesize_speech(text, language_code="en", voice="com", slow=False, engine="gtts"):
+    """Synthesize text with a TTS engine and return the encoded audio bytes"""
+    backend = get_backend(engine)
+    # Tagged with the engine that actually runs, which is gTTS if the requested one can't load
+    with metrics.span("tts_request", chars=len(text), engine=backend.name):
+        return backend.synthesize(text, language_code, voice, slow)
+
+
+def is_rate_limit_error(error):
+    """Return True if a gTTS exception was caused by an HTTP 429 response"""
+    response = getattr(error, "rsp", None)
+    if response is not None and getattr(response, "status_code", None) == 429:
+        return True
+    return "429" in str(error) or "Too Many Requests" in str(error)
+
+
+def rate_limit_stats():
+    """Return the shared limiter's counters for display and monitoring"""
+    return {
+        "queued": tts_bucket.queued,
+        "throttled": tts_bucket.throttled,
+        "requests": tts_bucket.acquired,
+        "retried": tts_retry.retried,
+        "rate_limited": tts_retry.exhausted,
+        "wait_seconds": tts_bucket.wait_seconds,
+    }
+
+
+def synthesize_limited(text, language_code="en", voice="com", slow=False, engine="gtts"):
+    """Synthesize text under the shared quota, backing off on 429s
+
+    Local engines have no quota and are called directly.
+    """
+    if get_backend(engine).local:
+        return synthesize_speech(text, language_code, voice, slow, engine)
+    return tts_retry.call(
+        lambda: synthesize_speech(text, language_code, voice, slow, engine),
+        is_rate_limit_error,
+        bucket=tts_bucket,
+    )
+
+
+def get_segment_audio(segment, language_code="en", voice="com", slow=False, engine="gtts"):
+    """Return audio bytes for one segment, synthesizing only on a cache miss"""
+    key = audio_cache.make_key(segment, language_code, voice, slow, engine)
+    audio_bytes = audio_cache.get(key)
+    if audio_bytes is None:
+        audio_bytes = synthesize_limited(segment, language_code, voice, slow, engine)
+        audio_cache.put(key, audio_bytes)
+    return audio_bytes
+
+
+def join_audio(segments):
+    """Join audio segments from one engine into one playable stream"""
+    if len(segments) == 1:
+        return segments[0]
+    if audio_format(segments[0]) == "audio/wav":
+        return join_wav(segments)
+    try:
+        # Imported lazily: pydub needs audioop (or audioop-lts on Python 3.13+) and ffmpeg
+        from pydub import AudioSegment
+
+        combined = AudioSegment.empty()
+        for segment in segments:
+            combined += AudioSegment.from_file(BytesIO(segment), format="mp3")
+        output = BytesIO()
+        combined.export(output, format="mp3")
+        return output.getvalue()
+    except Exception:
+        # gTTS output is a plain sequence of MP3 frames, so byte-wise
+        # concatenation still plays (gTTS does the same for its own chunks)
+        return b"".join(segments)
+
+
+def join_wav(segments):
+    """Join WAV segments by concatenating their frames under one header"""
+    output = BytesIO()
+    with wave.open(output, "wb") as joined:
+        for i, segment in enumerate(segments):
+            with wave.open(BytesIO(segment), "rb") as part:
+                if i == 0:
+                    joined.setparams(part.getparams())
+                # espeak-ng streams with a placeholder length; reading stops at the end of the data anyway
+                joined.writeframes(part.readframes(part.getnframes()))
+    return output.getvalue()
+
+
+def generate_tts_audio(text, language_code="en", voice="com", slow=False, engine="gtts"):
+    """Return (audio_bytes, feedback_msg) for text, synthesizing only on a cache miss
+
+    Long text is split into sentence segments that are synthesized in
+    parallel and cached individually, so a regenerated reply only pays for
+    the sentences that changed. Safe to call from worker threads: it never
+    touches Streamlit state.
+    """
+    try:
+        # Audio is cached process-wide by content, so repeated text is never re-synthesized
+        cache_key = audio_cache.make_key(text, language_code, voice, slow, engine)
+        audio_bytes = audio_cache.get(cache_key)
+        if audio_bytes is not None:
+            metrics.observe_size("tts_audio_cached", len(audio_bytes))
+            return audio_bytes, None
+
+        with metrics.span("tts_synthesis", chars=len(text)) as span:
+            audio_bytes = _synthesize_text(text, language_code, voice, slow, engine)
+            span["bytes"] = len(audio_bytes)
+        metrics.observe_size("tts_audio", len(audio_bytes))
+
+        audio_cache.put(cache_key, audio_bytes)
+        return audio_bytes, None
+
+    except Exception as e:
+        # Handle specific rate limit errors
+        if is_rate_limit_error(e):
+            error_msg = "⚠️ TTS rate limit reached. Please wait a moment before generating more audio."
+        else:
+            error_msg = f"❌ Audio generation failed: {str(e)}"
+        return None, error_msg
+
+
+def _synthesize_text(text, language_code, voice, slow, engine):
+    """Synthesize text that missed the cache, in parallel segments when it is long"""
+    segments = split_segments(text)
+    if len(segments) <= 1:
+        return synthesize_limited(text, language_code, voice, slow, engine)
+    futures = [
+        _segment_executor.submit(get_segment_audio, segment, language_code, voice, slow, engine)
+        for segment in segments
+    ]
+    return join_audio([future.result() for future in futures])
+
+
+def split_sentences(text):
+    """Split text into sentences, dropping empty pieces"""
+    return [s.strip() for s in SENTENCE_BOUNDARY.split(text) if s.strip()]
+
+
+def _split_long(text, max_chars):
+    """Break an over-long sentence at clause boundaries, then spaces, then anywhere"""
+    pieces = []
+    current = ""
+    for clause in (c for c in CLAUSE_BOUNDARY.split(text) if c):
+        if len(clause) > max_chars:
+            words = clause.split(" ") if " " in clause else list(clause)
+            separator = " " if " " in clause else ""
+            # A word longer than a segment (e.g. a URL) is cut into segment-sized pieces, none of it dropped
+            words = [word[i:i + max_chars] for word in words for i in range(0, len(word), max_chars)]
+            clause_pieces = []
+            for word in words:
+                if clause_pieces and len(clause_pieces[-1]) + len(separator) + len(word) <= max_chars:
+                    clause_pieces[-1] += separator + word
+                else:
+                    clause_pieces.append(word)
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.extend(clause_pieces[:-1])
+            clause = clause_pieces[-1]
+        separator = " " if current and not current.endswith(" ") else ""
+        if current and len(current) + len(separator) + len(clause) > max_chars:
+            pieces.append(current)
+            current = clause
+        else:
+            current += separator + clause if current else clause
+    if current:
+        pieces.append(current)
+    return [p.strip() for p in pieces if p.strip()]
+
+
+def split_segments(text, max_chars=MAX_SEGMENT_CHARS):
+    """Split text into sentence segments no longer than max_chars
+
+    Segments follow sentence boundaries (the same ones used when streaming)
+    so that they line up with the audio the streaming pipeline already cached.
+    """
+    segments = []
+    for sentence in split_sentences(text):
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+        else:
+            segments.extend(_split_long(sentence, max_chars))
+    return segments
+
+
+class SentenceBuffer:
+    """Accumulate streamed text and release sentences once they are complete"""
+
+    def __init__(self):
+        self.pending = ""
+
+    def feed(self, chunk):
+        """Add a chunk of streamed text and return any completed sentences"""
+        self.pending += chunk
+        parts = SENTENCE_BOUNDARY.split(self.pending)
+        # The last part has no terminating boundary yet, keep it buffered
+        self.pending = parts.pop()
+        return [s.strip() for s in parts if s.strip()]
+
+    def flush(self):
+        """Return whatever is left in the buffer as a final sentence"""
+        remainder = self.pending.strip()
+        self.pending = ""
+        return [remainder] if remainder else []
+
+
+class SpeechPipeline:
+    """Synthesize sentences in the background as soon as they are submitted"""
+
+    def __init__(self, language_code="en", voice="com", slow=False, engine="gtts"):
+        self.language_code = language_code
+        self.voice = voice
+        self.slow = slow
+        self.engine = engine
+        self.futures = []
+
+    def submit(self, sentence):
+        """Queue a completed sentence for synthesis"""
+        # Imported here because the worker pool itself imports this module
+        from tts_worker import tts_pool
+        self.futures.append(tts_pool.submit(
+            sentence, self.language_code, self.voice, self.slow, self.engine, block=True
+        ))
+
+    def first_audio(self):
+        """Return the first segment's audio if it has finished, otherwise None"""
+        if not self.futures or not self.futures[0].done():
+            return None
+        audio_bytes, _ = self.futures[0].result()
+        return audio_bytes
+
+    def join(self):
+        """Wait for all segments and return them as one audio stream"""
+        segments = []
+        for future in self.futures:
+            audio_bytes, error_msg = future.result()
+            if audio_bytes is None:
+                raise RuntimeError(error_msg)
+            segments.append(audio_bytes)
+        return join_audio(segments)
+
+    def store(self, text, audio_bytes):
+        """Cache the joined audio under the full reply text, along with its encoded variants"""
+        key = audio_cache.make_key(text, self.language_code, self.voice, self.slow, self.engine)
+        audio_cache.put(key, audio_bytes)
+        audio_encoder.encode_all(key, audio_bytes)
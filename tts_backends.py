@@ -0,0 +1,146 @@
+import os
+import shutil
+import subprocess
+import threading
+from io import BytesIO
+
+# Engine used for every voice and language, overriding the config tables (e.g. "espeak")
+TTS_ENGINE_OVERRIDE = os.getenv("TTS_ENGINE")
+
+# espeak-ng executable and speaking rates (words per minute) for normal and slow speech
+ESPEAK_BINARY = os.getenv("ESPEAK_BINARY", "espeak-ng")
+ESPEAK_WPM = int(os.getenv("ESPEAK_WPM", "170"))
+ESPEAK_SLOW_WPM = int(os.getenv("ESPEAK_SLOW_WPM", "120"))
+
+
+class TTSBackend:
+    """Text-to-speech engine interface
+
+    synthesize() takes text, a TTS language code such as "en" and the
+    engine-specific voice returned by voice_id(), and returns encoded audio
+    bytes. Local engines run on this machine and are not rate limited.
+    """
+
+    name = "base"
+    local = False
+
+    def voice_id(self, voice_config):
+        """Return this engine's voice for an entry of the VOICES table"""
+        raise NotImplementedError
+
+    def supports(self, language_code):
+        return True
+
+    def synthesize(self, text, language_code, voice, slow=False):
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate text-to-speech (network round-trip per request, MP3 output)"""
+
+    name = "gtts"
+
+    def __init__(self):
+        import gtts  # Imported with the backend, so pages that never synthesize don't load it
+
+        self.gtts = gtts
+
+    def voice_id(self, voice_config):
+        # gTTS has a single voice per language; the regional domain is the closest thing to a choice
+        return voice_config["tld"]
+
+    def synthesize(self, text, language_code, voice, slow=False):
+        tts = self.gtts.gTTS(text=text, lang=language_code, slow=slow, tld=voice)
+        audio_buffer = BytesIO()
+        tts.write_to_fp(audio_buffer)
+        return audio_buffer.getvalue()
+
+
+class EspeakBackend(TTSBackend):
+    """Offline synthesis with the espeak-ng command line tool (WAV output)"""
+
+    name = "espeak"
+    local = True
+
+    # TTS codes whose espeak-ng voice has a different name
+    LANGUAGE_VOICES = {"zh-CN": "cmn"}
+
+    def __init__(self, binary=ESPEAK_BINARY):
+        self.binary = shutil.which(binary)
+        if self.binary is None:
+            raise RuntimeError(f"{binary} is not installed")
+        # Voice list is read once; each synthesis is then a single short-lived process
+        listing = subprocess.run(
+            [self.binary, "--voices"], capture_output=True, text=True, check=True, timeout=10
+        ).stdout
+        self.languages = {line.split()[1] for line in listing.splitlines()[1:] if len(line.split()) > 1}
+
+    def _language(self, language_code):
+        language = self.LANGUAGE_VOICES.get(language_code, language_code.lower())
+        return language if language in self.languages else language.split("-")[0]
+
+    def voice_id(self, voice_config):
+        return voice_config["espeak_variant"]
+
+    def supports(self, language_code):
+        return self._language(language_code) in self.languages
+
+    def synthesize(self, text, language_code, voice, slow=False):
+        result = subprocess.run(
+            [self.binary, "--stdout", "--stdin", "-v", f"{self._language(language_code)}+{voice}",
+             "-s", str(ESPEAK_SLOW_WPM if slow else ESPEAK_WPM)],
+            input=text.encode("utf-8"), capture_output=True, timeout=60,
+        )
+        if result.returncode != 0 or not result.stdout:
+            raise RuntimeError(f"espeak-ng failed: {result.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+
+
+BACKENDS = {
+    "gtts": GTTSBackend,
+    "espeak": EspeakBackend,
+}
+
+# One instance per engine for the whole process
+_backends = {}
+_unavailable = {}  # engine name -> reason it could not be initialized
+_backends_lock = threading.RLock()
+
+
+def get_backend(name):
+    """Return the shared backend for an engine name, falling back to gTTS if it can't load"""
+    return _load_backend(TTS_ENGINE_OVERRIDE or name)
+
+
+def _load_backend(name):
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is not None:
+            return backend
+        try:
+            backend = BACKENDS[name]()
+        except Exception as e:
+            if name == "gtts":
+                raise
+            _unavailable[name] = str(e) or type(e).__name__
+            backend = _load_backend("gtts")
+        _backends[name] = backend
+        return backend
+
+
+def select_backend(language_config, voice_config):
+    """Return (backend, voice id) for an entry of the LANGUAGES and VOICES tables
+
+    A voice's tts_engine takes precedence over its language's; engines that
+    can't load or don't speak the language fall back to gTTS.
+    """
+    backend = get_backend(voice_config.get("tts_engine") or language_config.get("tts_engine", "gtts"))
+    if not backend.supports(language_config["tts_code"]):
+        backend = _load_backend("gtts")
+    return backend, backend.voice_id(voice_config)
+
+
+def unavailable_engines():
+    """Return the engines that failed to initialize and why"""
+    with _backends_lock:
+        return dict(_unavailable)
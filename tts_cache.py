@@ -0,0 +1,31 @@
+import hashlib
+import os
+
+from blob_store import BlobStore
+
+
+class AudioCache(BlobStore):
+    """Disk-backed audio cache keyed by content, with a byte cap and LRU eviction
+
+    One instance is shared by every session in the process, so the same text
+    spoken with the same settings is only ever synthesized once.
+    """
+
+    def __init__(self, directory, max_bytes):
+        super().__init__(directory, max_bytes, extension=".mp3")
+
+    @staticmethod
+    def make_key(text, language_code, voice, slow, engine="gtts"):
+        """Hash the synthesis inputs into a cache key"""
+        parts = [text, language_code, voice, "slow" if slow else "normal"]
+        if engine != "gtts":
+            parts.append(engine)  # gTTS keys predate the other engines and stay valid
+        payload = "\x00".join(parts)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Process-wide cache shared by all sessions
+audio_cache = AudioCache(
+    os.getenv("TTS_CACHE_DIR", ".tts_cache"),
+    int(os.getenv("TTS_CACHE_MAX_BYTES", str(200 * 1024 * 1024))),
+)
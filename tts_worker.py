@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from audio_encoding import audio_encoder
+from metrics import metrics
+from tts import generate_tts_audio
+from tts_cache import audio_cache
+
+
+class TTSWorkerPool:
+    """Bounded pool of threads that synthesize speech off the page's render path
+
+    Jobs are deduplicated by cache key, so a reply that is being synthesized
+    for one rerun (or one session) is not queued again by the next.
+    """
+
+    def __init__(self, max_workers, max_queue, failure_cooldown=30.0):
+        self._jobs = queue.Queue(maxsize=max_queue)
+        self._in_flight = {}  # cache key -> Future
+        self._failures = {}  # cache key -> (Future, finished at), kept so errors aren't retried on every rerun
+        self.failure_cooldown = failure_cooldown
+        self._lock = threading.Lock()
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f"tts-worker-{i}", daemon=True).start()
+
+    def submit(self, text, language_code="en", voice="com", slow=False, engine="gtts", block=False):
+        """Queue synthesis for text and return a Future of (audio_bytes, feedback_msg)
+
+        Returns None if the queue is full and block is False; callers should
+        show the audio as pending and try again later.
+        """
+        key = audio_cache.make_key(text, language_code, voice, slow, engine)
+        if key in audio_cache:
+            # Already synthesized, no need to involve a worker
+            future = Future()
+            future.set_result(generate_tts_audio(text, language_code, voice, slow, engine))
+            return future
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+
+            failure = self._failures.get(key)
+            if failure is not None:
+                if time.monotonic() - failure[1] < self.failure_cooldown:
+                    return failure[0]
+                del self._failures[key]
+
+            future = Future()
+            if not block:
+                try:
+                    self._jobs.put_nowait((key, future, (text, language_code, voice, slow, engine), time.perf_counter()))
+                except queue.Full:
+                    return None
+            self._in_flight[key] = future
+
+        if block:
+            self._jobs.put((key, future, (text, language_code, voice, slow, engine), time.perf_counter()))
+        return future
+
+    def submit_encode(self, key, audio_bytes, codec):
+        """Queue transcoding of the audio cached under key and return a Future of (key, audio_bytes)
+
+        Returns None if the queue is full; callers show the audio as pending and try again later.
+        """
+        variant = audio_encoder.variant_key(key, codec)
+        with self._lock:
+            future = self._in_flight.get(variant)
+            if future is None:
+                future = Future()
+                try:
+                    self._jobs.put_nowait((variant, future, (key, audio_bytes, codec), time.perf_counter()))
+                except queue.Full:
+                    return None
+                self._in_flight[variant] = future
+        return future
+
+    def pending(self):
+        """Return the number of jobs queued or being synthesized"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def _work(self):
+        while True:
+            key, future, args, queued_at = self._jobs.get()
+            metrics.record("tts_queue_wait", time.perf_counter() - queued_at)
+            if len(args) == 3:
+                # Transcoding job from submit_encode; encode() never raises
+                result = audio_encoder.encode(*args)
+            else:
+                try:
+                    result = generate_tts_audio(*args)
+                except Exception as e:
+                    result = (None, f"❌ Audio generation failed: {str(e)}")
+                if result[0] is not None:
+                    # Encode for delivery now, so the page finds the compact variants ready
+                    audio_encoder.encode_all(key, result[0])
+            with self._lock:
+                # The audio cache serves successful jobs from here on
+                self._in_flight.pop(key, None)
+                if result[0] is None:
+                    self._failures[key] = (future, time.monotonic())
+            future.set_result(result)
+            self._jobs.task_done()
+
+
+# Process-wide pool shared by all sessions
+tts_pool = TTSWorkerPool(
+    max_workers=int(os.getenv("TTS_WORKERS", "4")),
+    max_queue=int(os.getenv("TTS_QUEUE_SIZE", "64")),
+)